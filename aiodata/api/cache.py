@@ -0,0 +1,156 @@
+import re
+import time
+import pickle
+import sqlite3
+import asyncio
+import threading
+import collections
+from abc import ABC, abstractmethod
+
+
+class CacheEntry:
+
+    __slots__ = ("data", "headers", "etag", "last_modified", "expires")
+
+    def __init__(self, data, headers, etag=None, last_modified=None, expires=0.0):
+        self.data = data
+        self.headers = headers
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires
+
+    @property
+    def revalidatable(self):
+        return self.etag is not None or self.last_modified is not None
+
+    def __getstate__(self):
+        return tuple(getattr(self, s) for s in self.__slots__)
+
+    def __setstate__(self, state):
+        for s, v in zip(self.__slots__, state):
+            setattr(self, s, v)
+
+
+class Cache(ABC):
+    """
+    Cache for parsed GET responses. Entries are fresh for ``ttl`` seconds (or the max-age of the response),
+    stale entries with an ETag or Last-Modified header are revalidated with a conditional request.
+    Hits, misses and revalidations are counted in ``stats``.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.stats = collections.Counter()
+
+    @staticmethod
+    def key(method, url, params=None):
+        params = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+        return method.upper(), str(url), params
+
+    def entry_from_response(self, data, headers):
+        cache_control = headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        max_age = _max_age.search(cache_control)
+        ttl = int(max_age.group(1)) if max_age else self.ttl
+        if "no-cache" in cache_control:
+            ttl = 0
+        return CacheEntry(data, headers, headers.get("ETag"), headers.get("Last-Modified"), time.time() + ttl)
+
+    @abstractmethod
+    async def get(self, key):
+        pass
+
+    @abstractmethod
+    async def set(self, key, entry):
+        pass
+
+    @abstractmethod
+    async def clear(self):
+        pass
+
+
+_max_age = re.compile(r"max-age\s*=\s*(\d+)")
+
+
+class MemoryCache(Cache):
+    """
+    In-memory LRU cache of at most ``maxsize`` responses. Entries are stored pickled, so every hit returns
+    a new copy and changes to a returned response don't alter the cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return pickle.loads(entry)
+
+    async def set(self, key, entry):
+        self.entries[key] = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    async def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteCache(Cache):
+    """On-disk cache that stores pickled responses in a SQLite database. Queries run in an executor thread."""
+
+    def __init__(self, path, ttl=300, loop=None, executor=None):
+        super().__init__(ttl)
+        self.path = path
+        self.loop = loop
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, entry BLOB)")
+
+    def _run(self, func, *args):
+        loop = self.loop or asyncio.get_event_loop()
+
+        def locked():
+            with self._lock:
+                return func(*args)
+
+        return loop.run_in_executor(self.executor, locked)
+
+    def _get(self, key):
+        row = self._connection.execute("SELECT entry FROM responses WHERE key = ?", (repr(key),)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def _set(self, key, entry):
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses (key, entry) VALUES (?, ?)",
+                                     (repr(key), pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)))
+
+    def _clear(self):
+        with self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+    async def get(self, key):
+        return await self._run(self._get, key)
+
+    async def set(self, key, entry):
+        await self._run(self._set, key, entry)
+
+    async def clear(self):
+        await self._run(self._clear)
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,175 @@
+import pandas as pd
+from .spec import FieldType
+from ..utils import batched
+
+pandas_types = {
+    FieldType.STRING: "object",
+    FieldType.INTEGER: "Int64",
+    FieldType.DECIMAL: "float64",
+    FieldType.BOOLEAN: "boolean",
+    FieldType.DATETIME: "datetime64[ns]",
+    FieldType.DATE: "object",
+    FieldType.TIME: "object",
+    FieldType.ARRAY: "object",
+    FieldType.OBJECT: "object",
+}
+
+
+def _arrow_type(field_type):
+    import pyarrow as pa
+    return {
+        FieldType.STRING: pa.string(),
+        FieldType.INTEGER: pa.int64(),
+        FieldType.DECIMAL: pa.float64(),
+        FieldType.BOOLEAN: pa.bool_(),
+        FieldType.DATETIME: pa.timestamp("us"),
+        FieldType.DATE: pa.date32(),
+        FieldType.TIME: pa.time64("us"),
+    }.get(field_type)
+
+
+def _item_data(item):
+    if hasattr(item, "to_dict"):
+        return item.to_dict()
+    return getattr(item, "data", item)
+
+
+def _columns(batch, names=None):
+    """Fill a buffer per column from a batch of items. Without ``names`` all keys of the batch are used."""
+    rows = [_item_data(item) for item in batch]
+    if names is None:
+        names = list(dict.fromkeys(key for row in rows for key in row))
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def _model_types(model):
+    return {f.name: f.type for f in model.fields} if model is not None else {}
+
+
+async def to_dataframe(iterable, batch_size=10000, model=None):
+    field_types = _model_types(model)
+    names = list(field_types) or None
+    frames = []
+    async for batch in batched(iterable, batch_size):
+        frame = pd.DataFrame(_columns(batch, names))
+        for name, field_type in field_types.items():
+            if field_type == FieldType.DATETIME:
+                frame[name] = pd.to_datetime(frame[name])
+            else:
+                frame[name] = frame[name].astype(pandas_types[field_type])
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=names)
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def _promote(name, a, b):
+    import pyarrow as pa
+
+    if a.equals(b) or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        return pa.int64()
+    if (pa.types.is_integer(a) or pa.types.is_floating(a)) and (pa.types.is_integer(b) or pa.types.is_floating(b)):
+        return pa.float64()
+    raise ValueError(f"Column '{name}' has values of type {a} and {b}, pass a model to define its type")
+
+
+def unify_schemas(schema, other):
+    """
+    Combine the schemas of two batches. Columns of both are kept, null columns take the type of the
+    other schema and integers are promoted to floats. Other type differences raise a ValueError.
+    """
+    import pyarrow as pa
+
+    if schema is None:
+        return other
+    types = {f.name: f.type for f in schema}
+    for f in other:
+        types[f.name] = _promote(f.name, types[f.name], f.type) if f.name in types else f.type
+    return pa.schema(list(types.items()))
+
+
+def conform(record_batch, schema):
+    """Cast a RecordBatch to a unified ``schema``, adding null columns for missing fields."""
+    import pyarrow as pa
+
+    names = record_batch.schema.names
+    arrays = [record_batch.column(names.index(f.name)).cast(f.type) if f.name in names
+              else pa.nulls(record_batch.num_rows, f.type) for f in schema]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def iter_record_batches(iterable, batch_size=10000, model=None):
+    """
+    Yield pyarrow RecordBatches. Columns and types come from the model where it defines them, everything
+    else is inferred for every batch, so the schemas of the batches can differ. Use ``unify_schemas`` and
+    ``conform`` to combine them.
+    """
+    import pyarrow as pa
+
+    field_types = {name: _arrow_type(t) for name, t in _model_types(model).items()}
+    names = list(field_types) or None
+
+    async for batch in batched(iterable, batch_size):
+        columns = _columns(batch, names)
+        arrays = [pa.array(values, type=field_types.get(name)) for name, values in columns.items()]
+        yield pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+
+async def to_arrow(iterable, batch_size=10000, model=None):
+    import pyarrow as pa
+
+    batches = []
+    schema = None
+    async for record_batch in iter_record_batches(iterable, batch_size, model):
+        schema = unify_schemas(schema, record_batch.schema)
+        batches.append(record_batch)
+    if not batches:
+        return pa.table({})
+    return pa.Table.from_batches([conform(b, schema) for b in batches], schema=schema)
+
+
+async def to_parquet(iterable, path, batch_size=10000, model=None, buffer_batches=10, **kwargs):
+    """
+    Write the items to a Parquet file. The schema of the file is fixed when it's created, so batches are
+    buffered while columns are all null, for up to ``buffer_batches`` batches, until their type is known.
+    Type changes after that raise a ValueError.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    buffered = []
+
+    def write(record_batch):
+        writer.write_table(pa.Table.from_batches([conform(record_batch, schema)], schema=schema))
+
+    try:
+        async for record_batch in iter_record_batches(iterable, batch_size, model):
+            if writer is not None:
+                if not unify_schemas(schema, record_batch.schema).equals(schema):
+                    raise ValueError(f"The schema changed after the Parquet file was created: {record_batch.schema}, "
+                                     "pass a model to define the column types")
+                write(record_batch)
+                continue
+
+            schema = unify_schemas(schema, record_batch.schema)
+            buffered.append(record_batch)
+            if len(buffered) < buffer_batches and any(pa.types.is_null(f.type) for f in schema):
+                continue
+            writer = pq.ParquetWriter(path, schema, **kwargs)
+            for b in buffered:
+                write(b)
+            buffered = []
+
+        if buffered:
+            writer = pq.ParquetWriter(path, schema, **kwargs)
+            for b in buffered:
+                write(b)
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,239 @@
+import re
+import asyncio
+import collections
+from abc import ABC, abstractmethod
+from urllib.parse import urljoin
+
+
+class Pagination(ABC):
+    """
+    Strategy that describes how the pages of a collection are requested.
+    Strategies that are ``predictable`` can compute the request of every page up front,
+    so pages can be prefetched concurrently. The others need the previous response.
+    """
+
+    predictable = False
+    default_items_keys = ("items", "data", "results")
+
+    def __init__(self, items_key=None):
+        self.items_key = items_key
+
+    def items(self, data):
+        if self.items_key is not None:
+            return lookup(data, self.items_key) or []
+        if isinstance(data, dict):
+            for key in self.default_items_keys:
+                if key in data:
+                    return data[key] or []
+            raise ValueError(f"No items found in the response with the keys {', '.join(map(str, data))}, "
+                             f"pass the items_key of the pagination")
+        return data or []
+
+    def page(self, url, params, n):
+        raise NotImplementedError(f"{self.__class__.__name__} cannot compute pages up front")
+
+    @abstractmethod
+    def next_page(self, url, params, n, data, headers):
+        """Return ``(url, params)`` of the page after page ``n`` or None if it was the last page."""
+        pass
+
+
+class OffsetPagination(Pagination):
+    """
+    Request pages of ``page_size`` items by offset. Without a ``page_size`` the server decides the size
+    of the pages, every page is requested after the previous one and only an empty page ends the collection.
+    """
+
+    def __init__(self, page_size=100, limit_param="limit", offset_param="offset", start=0, items_key=None):
+        super().__init__(items_key)
+        self.predictable = page_size is not None
+        self.page_size = page_size
+        self.limit_param = limit_param
+        self.offset_param = offset_param
+        self.start = start
+
+    def page(self, url, params, n):
+        if self.page_size is None:
+            return super().page(url, params, n)
+        params = dict(params or {})
+        params[self.limit_param] = self.page_size
+        params[self.offset_param] = self.start + n * self.page_size
+        return url, params
+
+    def next_page(self, url, params, n, data, headers):
+        items = self.items(data)
+        if self.page_size is not None:
+            return self.page(url, params, n + 1) if len(items) >= self.page_size else None
+        if not items:
+            return None
+        params = dict(params or {})
+        params[self.offset_param] = int(params.get(self.offset_param, self.start)) + len(items)
+        return url, params
+
+
+class PagePagination(Pagination):
+
+    predictable = True
+
+    def __init__(self, page_size=100, page_param="page", size_param="per_page", start=1, items_key=None):
+        super().__init__(items_key)
+        self.page_size = page_size
+        self.page_param = page_param
+        self.size_param = size_param
+        self.start = start
+
+    def page(self, url, params, n):
+        params = dict(params or {})
+        params[self.page_param] = self.start + n
+        if self.size_param is not None and self.page_size is not None:
+            params[self.size_param] = self.page_size
+        return url, params
+
+    def next_page(self, url, params, n, data, headers):
+        items = self.items(data)
+        # without a page size the server decides it, so only an empty page ends the collection
+        sized = self.size_param is not None and self.page_size is not None
+        if not items or (sized and len(items) < self.page_size):
+            return None
+        return self.page(url, params, n + 1)
+
+
+class CursorPagination(Pagination):
+
+    default_next_keys = ("next_cursor", "nextCursor", "next_page_token", "nextPageToken", "next")
+
+    def __init__(self, cursor_param="cursor", next_key=None, items_key=None):
+        super().__init__(items_key)
+        self.cursor_param = cursor_param
+        self.next_key = next_key
+
+    def next_page(self, url, params, n, data, headers):
+        if not isinstance(data, dict):
+            return None
+        if self.next_key is not None:
+            cursor = lookup(data, self.next_key)
+        else:
+            cursor = next((data[k] for k in self.default_next_keys if data.get(k)), None)
+        if not cursor:
+            return None
+        params = dict(params or {})
+        params[self.cursor_param] = cursor
+        return url, params
+
+
+class LinkHeaderPagination(Pagination):
+    """Follow the ``rel="next"`` link of the RFC 5988 ``Link`` header."""
+
+    def next_page(self, url, params, n, data, headers):
+        next_url = parse_link_header(headers.get("Link", "")).get("next")
+        if next_url is None:
+            return None
+        # the next link already contains all query parameters
+        return urljoin(str(url), next_url), None
+
+
+_link = re.compile(r"<([^>]*)>([^<]*)")
+_link_rel = re.compile(r"""rel\s*=\s*(?:"([^"]*)"|([^\s;,]*))""")
+
+
+def parse_link_header(value):
+    """Parse an RFC 5988 ``Link`` header into a dict mapping each relation type to its URL."""
+    links = {}
+    for url, link_params in _link.findall(value):
+        match = _link_rel.search(link_params)
+        if match is None:
+            continue
+        for rel in (match.group(1) or match.group(2)).split():
+            links.setdefault(rel.lower(), url)
+    return links
+
+
+def lookup(data, key):
+    """Look up a dot separated key in nested dicts."""
+    for part in key.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data
+
+
+def _page_size(parameter):
+    # the largest page the server allows or its default page size
+    if isinstance(parameter, dict):
+        size = parameter.get("maximum", parameter.get("default"))
+        if isinstance(size, int) and size > 0:
+            return size
+    return None
+
+
+def detect_pagination(parameters):
+    """
+    Guess the pagination strategy of an operation from its query parameters, given as OpenAPI parameter
+    objects or names. The page size is taken from the maximum or default of the size parameter, if it has
+    neither the server decides the page size.
+    """
+    parameters = {p["name"] if isinstance(p, dict) else p: p for p in parameters}
+    names = set(parameters)
+
+    if "offset" in names and "limit" in names:
+        return OffsetPagination(page_size=_page_size(parameters["limit"]))
+
+    for cursor in ("cursor", "page_token", "pageToken", "next_token", "after"):
+        if cursor in names:
+            return CursorPagination(cursor_param=cursor)
+
+    for page in ("page", "page_number", "pageNumber"):
+        if page in names:
+            size = next((n for n in ("per_page", "page_size", "pageSize", "size", "limit") if n in names), None)
+            return PagePagination(page_size=_page_size(parameters.get(size)), page_param=page, size_param=size)
+
+    return None
+
+
+async def paginate(session, url, pagination, params=None, prefetch=0):
+    """
+    Yield the items of all pages of a collection. If ``prefetch`` is set, pages are requested
+    while the current page is consumed: ``prefetch`` pages concurrently if the pagination is
+    predictable, otherwise the next page as soon as its request is known.
+    """
+
+    def fetch(request):
+        page_url, page_params = request
+        return asyncio.ensure_future(session.fetch("GET", page_url, params=page_params))
+
+    pending = collections.deque()
+    n = 0
+
+    if pagination.predictable:
+        requests = [pagination.page(url, params, i) for i in range(prefetch + 1)]
+    else:
+        requests = [(url, params)]
+    pending.extend((request, fetch(request)) for request in requests)
+    scheduled = len(pending)
+
+    try:
+        while pending:
+            request, future = pending.popleft()
+            data, headers = await future
+
+            next_request = pagination.next_page(request[0], request[1], n, data, headers)
+            if next_request is None:
+                for _, f in pending:
+                    f.cancel()
+                pending.clear()
+            elif pagination.predictable:
+                ahead = pagination.page(url, params, scheduled)
+                pending.append((ahead, fetch(ahead)))
+                scheduled += 1
+            elif prefetch:
+                pending.append((next_request, fetch(next_request)))
+
+            for item in pagination.items(data):
+                yield item
+
+            if next_request is not None and not pending:
+                pending.append((next_request, fetch(next_request)))
+            n += 1
+    finally:
+        for _, f in pending:
+            f.cancel()
@@ -0,0 +1,269 @@
+"""
+Lazy operator pipeline of ResourceIterable.
+
+Operators are only recorded when they are applied. When iteration starts, consecutive synchronous
+operators are fused into a single loop over the source, so a chain of operators costs one async
+generator instead of one per operator. Operators that need to await run as separate stages.
+"""
+import os
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from ..utils import BloomFilter, fingerprint, batched, map_concurrent
+
+SKIP = object()
+
+
+class Pipeline:
+    """Per-iteration state shared by the fused operators."""
+
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class Operator:
+    """A synchronous operator. ``start`` returns the function applied to every item, which returns SKIP to drop it."""
+
+    def start(self, pipeline):
+        raise NotImplementedError
+
+
+class AsyncOperator:
+    """An operator that transforms the whole async iterator and can't be fused."""
+
+    def apply(self, source):
+        raise NotImplementedError
+
+
+class Map(Operator):
+
+    def __init__(self, func):
+        self.func = func
+
+    def start(self, pipeline):
+        return self.func
+
+
+class Filter(Operator):
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def start(self, pipeline):
+        predicate = self.predicate
+        return lambda item: item if predicate(item) else SKIP
+
+
+class Distinct(Operator):
+
+    def __init__(self, key=None, max_items=None, error_rate=0.001):
+        if isinstance(key, str):
+            field = key
+            key = lambda item: item.get(field)
+        self.key = key
+        self.max_items = max_items
+        self.error_rate = error_rate
+
+    def start(self, pipeline):
+        key = self.key
+        seen = BloomFilter(self.max_items, self.error_rate) if self.max_items else set()
+        # values that aren't JSON-like are kept themselves and compared by equality
+        others = None if self.max_items else set()
+
+        def step(item):
+            value = item if key is None else key(item)
+            try:
+                fp, target = fingerprint(value), seen
+            except TypeError:
+                if others is None:
+                    raise TypeError(f"Can't fingerprint a value of type {type(value).__name__}, "
+                                    f"pass a key that returns JSON-like values") from None
+                fp, target = value, others
+            if fp in target:
+                return SKIP
+            target.add(fp)
+            return item
+
+        return step
+
+
+class Skip(Operator):
+
+    def __init__(self, n):
+        self.n = n
+
+    def start(self, pipeline):
+        remaining = self.n
+
+        def step(item):
+            nonlocal remaining
+            if remaining > 0:
+                remaining -= 1
+                return SKIP
+            return item
+
+        return step
+
+
+class Take(Operator):
+
+    def __init__(self, n):
+        self.n = n
+
+    def start(self, pipeline):
+        remaining = self.n
+        if remaining <= 0:
+            pipeline.stop()
+
+        def step(item):
+            nonlocal remaining
+            if remaining <= 0:
+                return SKIP
+            remaining -= 1
+            if remaining == 0:
+                # no more items are needed from the source
+                pipeline.stop()
+            return item
+
+        return step
+
+
+class Batch(Operator):
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f"size must be at least 1, got {size}")
+        self.size = size
+
+    def start(self, pipeline):
+        return _BatchStep(self.size)
+
+
+class _BatchStep:
+
+    def __init__(self, size):
+        self.size = size
+        self.batch = []
+
+    def __call__(self, item):
+        self.batch.append(item)
+        if len(self.batch) < self.size:
+            return SKIP
+        batch, self.batch = self.batch, []
+        return batch
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        return batch or SKIP
+
+
+class AsyncMap(AsyncOperator):
+
+    def __init__(self, func):
+        self.func = func
+
+    async def apply(self, source):
+        async for item in source:
+            yield await self.func(item)
+
+
+class ParallelMap(AsyncOperator):
+    """
+    Apply ``func`` in a thread or process pool. Items are sent to the pool in chunks of ``chunksize``
+    and at most two chunks per worker are in flight, so the source is only consumed as fast as the
+    pool keeps up. ``executor`` is an Executor or ``"thread"``/``"process"`` to create a pool of ``workers``.
+    """
+
+    def __init__(self, func, executor=None, workers=None, chunksize=100, ordered=True):
+        if executor is not None and not isinstance(executor, Executor) and executor not in ("thread", "process"):
+            raise ValueError(f"'{executor}' is not valid for executor")
+        self.func = func
+        self.executor = executor
+        self.workers = workers
+        self.chunksize = chunksize
+        self.ordered = ordered
+
+    async def apply(self, source):
+        from .resource import ResourceObject, ResourceRecord
+
+        loop = asyncio.get_event_loop()
+        executor = self.executor
+        owned = not isinstance(executor, Executor)
+        if owned:
+            pool = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+            executor = pool(max_workers=self.workers)
+        in_process = isinstance(executor, ProcessPoolExecutor)
+        workers = self.workers or getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+
+        async def run(chunk):
+            if in_process:
+                # the API of a ResourceObject holds the HTTP session, which can't be sent to another process
+                items = [ResourceObject(item.data) if isinstance(item, ResourceObject) else item for item in chunk]
+            else:
+                items = chunk
+            results = await loop.run_in_executor(executor, _apply_chunk, self.func, items)
+            return chunk, results
+
+        try:
+            async for chunk, results in map_concurrent(run, batched(source, self.chunksize), 2 * workers,
+                                                       self.ordered):
+                for item, result in zip(chunk, results):
+                    if in_process and isinstance(result, (ResourceObject, ResourceRecord)) and result.api is None:
+                        result.api = getattr(item, "api", None)
+                    yield result
+        finally:
+            if owned:
+                executor.shutdown(wait=False)
+
+
+def _apply_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def compile_pipeline(source, operators):
+    """Chain the stages of a pipeline, fusing consecutive synchronous operators."""
+    fused = []
+    for operator in operators:
+        if isinstance(operator, AsyncOperator):
+            if fused:
+                source = run_fused(source, fused)
+                fused = []
+            source = operator.apply(source)
+        else:
+            fused.append(operator)
+    if fused:
+        source = run_fused(source, fused)
+    return source
+
+
+async def run_fused(source, operators):
+    pipeline = Pipeline()
+    steps = [operator.start(pipeline) for operator in operators]
+
+    if not pipeline.stopped:
+        async for item in source:
+            for step in steps:
+                item = step(item)
+                if item is SKIP:
+                    break
+            else:
+                yield item
+            if pipeline.stopped:
+                break
+
+    # emit the items buffered by batch operators
+    for i, step in enumerate(steps):
+        flush = getattr(step, "flush", None)
+        if flush is None:
+            continue
+        item = flush()
+        if item is SKIP:
+            continue
+        for later in steps[i + 1:]:
+            item = later(item)
+            if item is SKIP:
+                break
+        else:
+            yield item
@@ -1,7 +1,13 @@
 import asyncio
 import collections
+import copy
+import heapq
+import itertools
+import pickle
+import tempfile
 from typing import AsyncIterable, Iterable, Union
-from ..utils import returns, chain
+from .pipeline import compile_pipeline, Map, AsyncMap, ParallelMap, Filter, Distinct, Take, Skip, Batch
+from ..utils import returns, chain, map_concurrent, batched
 
 
 class ResourceObject(collections.UserDict):
@@ -41,75 +47,367 @@ class ResourceObject(collections.UserDict):
         return self
 
 
+class ResourceRecord:
+    """
+    Base class of compact records with a slot per field, created by ``make_record_class``.
+    Keys that are not fields of the record class are kept in an extra dict, so records convert
+    losslessly to and from dicts. Fields that were never set are left out of the dict.
+    """
+
+    __slots__ = ("api", "_extra")
+    fields = ()
+    _slot_names = {}
+
+    def __init__(self, data=None, api=None):
+        self.api = api
+        self._extra = None
+        if data:
+            self.update(data)
+
+    @classmethod
+    def from_dict(cls, data, api=None):
+        return cls(data, api)
+
+    def to_dict(self):
+        result = {}
+        for name, slot in self._slot_names.items():
+            try:
+                result[name] = getattr(self, slot)
+            except AttributeError:
+                pass
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    @property
+    def data(self):
+        return self.to_dict()
+
+    @property
+    def id(self):
+        return self.get("id")
+
+    @id.setter
+    def id(self, value):
+        self["id"] = value
+
+    def update(self, data):
+        slot_names = self._slot_names
+        for key, value in data.items():
+            slot = slot_names.get(key)
+            if slot is not None:
+                setattr(self, slot, value)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        slot = self._slot_names.get(key)
+        try:
+            if slot is not None:
+                return getattr(self, slot)
+            if self._extra is not None:
+                return self._extra[key]
+        except AttributeError:
+            pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __eq__(self, other):
+        if isinstance(other, ResourceRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, (dict, collections.UserDict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        # the record class is recreated from its fields, the API isn't pickled as it holds the HTTP session
+        return _restore_record, (self.__class__.__name__, self.fields, self.to_dict())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()})"
+
+    async def create(self):
+        ret = await self.api.post(json=self.to_dict())
+        self.update(ret)
+        return self
+
+    async def load(self):
+        ret = await self.api.get(self.id)
+        self.update(ret)
+        return self
+
+    async def commit(self):
+        ret = await self.api.put(json=self.to_dict())
+        self.update(ret)
+        return self
+
+    async def delete(self):
+        await self.api.delete(self.id)
+
+    async def to_sql(self, table):
+        await table.insert(self.to_dict())
+        return self
+
+
+_missing = object()
+_record_classes = {}
+
+
+def make_record_class(name, fields):
+    """
+    Create a ResourceRecord subclass with a slot for every field, given as names or model Fields.
+    Fields that are not valid identifiers or clash with record attributes are stored in the extra dict.
+    Classes are cached, so the same name and fields always give the same class.
+    """
+    names = tuple(getattr(f, "name", f) for f in fields)
+    cls = _record_classes.get((name, names))
+    if cls is not None:
+        return cls
+
+    reserved = set(dir(ResourceRecord))
+    # the id property is reserved, its field is stored in a slot that is not the name of another field
+    id_slot = "id_"
+    while id_slot in names:
+        id_slot += "_"
+    slot_names = {n: id_slot if n == "id" else n for n in names
+                  if n == "id" or n.isidentifier() and n not in reserved and not n.startswith("_")}
+    namespace = {
+        "__slots__": tuple(slot_names.values()),
+        "fields": names,
+        "_slot_names": slot_names,
+    }
+    cls = _record_classes[(name, names)] = type(name, (ResourceRecord,), namespace)
+    return cls
+
+
+def _restore_record(name, fields, data):
+    return make_record_class(name, fields)(data)
+
+
 class ResourceIterable(collections.AsyncIterable):
 
     def __init__(self, *iterables: Union[AsyncIterable[ResourceObject], Iterable[ResourceObject]]):
         self.data = chain(*iterables)
+        self.operators = ()
 
     async def __aiter__(self):
-        async for item in self.data:
+        async for item in compile_pipeline(self.data, self.operators):
             yield item
 
+    def _extend(self, operator):
+        # operators are recorded lazily and share the source
+        result = copy.copy(self)
+        result.operators = self.operators + (operator,)
+        return result
+
     @returns
-    async def create(self):
-        futures = []
-        async for item in self:
-            futures.append(asyncio.ensure_future(item.create()))
-        for f in asyncio.as_completed(futures):
-            yield f.result()
+    async def create(self, max_concurrency=100, ordered=False):
+        async for item in map_concurrent(lambda item: item.create(), self, max_concurrency, ordered):
+            yield item
 
     @returns
-    async def commit(self):
-        futures = []
-        async for item in self:
-            futures.append(asyncio.ensure_future(item.commit()))
-        for f in asyncio.as_completed(futures):
-            yield f.result()
+    async def commit(self, max_concurrency=100, ordered=False):
+        async for item in map_concurrent(lambda item: item.commit(), self, max_concurrency, ordered):
+            yield item
 
     @returns
-    async def delete(self):
-        futures = []
-        async for item in self:
-            futures.append(asyncio.ensure_future(item.delete()))
-        for f in asyncio.as_completed(futures):
-            yield f.result()
+    async def delete(self, max_concurrency=100, ordered=False):
+        async for item in map_concurrent(lambda item: item.delete(), self, max_concurrency, ordered):
+            yield item
 
     @returns
-    async def to_sql(self, table):
-        futures = [item.to_sql(table) async for item in self]
-        for f in asyncio.as_completed(futures):
-            yield f.result()
+    async def to_sql(self, table, batch_size=1000, max_concurrency=100, ordered=False):
+        if batch_size is None:
+            async for item in map_concurrent(lambda item: item.to_sql(table), self, max_concurrency, ordered):
+                yield item
+            return
 
-    def first(self):
-        it = self.__aiter__()
-        try:
-            return it.__anext__()
-        except StopAsyncIteration:
-            return None
+        async def insert(batch):
+            await table.insert_many([item.data for item in batch], batch_size=None)
+            return batch
+
+        async for batch in map_concurrent(insert, batched(self, batch_size), max_concurrency, ordered):
+            for item in batch:
+                yield item
+
+    async def first(self):
+        async for item in self.take(1):
+            return item
+        return None
 
     async def all(self):
         return [item async for item in self]
 
+    async def to_dataframe(self, batch_size=10000, model=None):
+        """
+        Collect the items into a pandas DataFrame, built from column buffers in batches of ``batch_size``.
+        If a ``model`` is given, its fields are the columns and their dtypes follow the field types.
+        """
+        from . import columnar
+        return await columnar.to_dataframe(self, batch_size, model)
+
+    async def to_arrow(self, batch_size=10000, model=None):
+        """Collect the items into a pyarrow Table, see ``to_dataframe``. Requires pyarrow."""
+        from . import columnar
+        return await columnar.to_arrow(self, batch_size, model)
+
+    async def to_parquet(self, path, batch_size=10000, model=None, **kwargs):
+        """Write the items to a Parquet file one batch at a time. Requires pyarrow."""
+        from . import columnar
+        await columnar.to_parquet(self, path, batch_size, model, **kwargs)
+
+    def to_records(self, record_class):
+        """Convert the items into compact records of a class created by ``make_record_class``."""
+        return self.map(lambda item: record_class(item.data if hasattr(item, "data") else item,
+                                                  getattr(item, "api", None)))
+
     async def sorted(self, key=None, reverse=False):
         return sorted(await self.all(), key=key, reverse=reverse)
 
     @returns
-    async def filter(self, predicate):
-        async for item in self:
-            if predicate(item):
-                yield item
+    async def external_sort(self, key=None, reverse=False, run_size=100000, loop=None, executor=None):
+        """
+        Sort lazily with at most ``run_size`` items in memory. Sorted runs are spilled to temporary files
+        in an executor thread and merged while the result is consumed.
+        """
+        if loop is None:
+            loop = asyncio.get_event_loop()
 
-    @returns
-    async def map(self, func):
-        async for item in self:
-            yield func(item)
+        runs = []
+        apis = []
+        try:
+            async for batch in batched(self, run_size):
+                batch.sort(key=key, reverse=reverse)
+                if not runs and len(batch) < run_size:
+                    # everything fits in memory
+                    for item in batch:
+                        yield item
+                    return
+                runs.append(await loop.run_in_executor(executor, _write_run, batch, apis))
 
-    @returns
-    async def distinct(self):
-        items = []
-        async for item in self:
-            if item in items:
-                continue
-            items.append(item)
-            yield item
+            merged = heapq.merge(*(_read_run(run, apis) for run in runs), key=key, reverse=reverse)
+            while True:
+                items = await loop.run_in_executor(executor, list, itertools.islice(merged, 1000))
+                if not items:
+                    break
+                for item in items:
+                    yield item
+        finally:
+            for run in runs:
+                run.close()
+
+    async def nlargest(self, n, key=None):
+        """Return the ``n`` largest items, keeping only a bounded buffer in memory."""
+        return await self._top(n, key, heapq.nlargest)
+
+    async def nsmallest(self, n, key=None):
+        """Return the ``n`` smallest items, keeping only a bounded buffer in memory."""
+        return await self._top(n, key, heapq.nsmallest)
+
+    async def top_k(self, k, key=None, largest=True):
+        return await (self.nlargest(k, key) if largest else self.nsmallest(k, key))
+
+    async def _top(self, n, key, select):
+        if n <= 0:
+            return []
+        buffer_size = max(4 * n, 1024)
+        top = []
+        async for batch in batched(self, buffer_size):
+            top = select(n, top + batch, key=key)
+        return top
 
+    def filter(self, predicate):
+        return self._extend(Filter(predicate))
+
+    def map(self, func, executor=None, workers=None, chunksize=100, ordered=True):
+        """
+        Apply ``func`` to every item. If ``executor`` (an Executor, ``"thread"`` or ``"process"``) or ``workers``
+        is given, ``func`` runs in chunks of ``chunksize`` items in a pool, in input order unless ``ordered``
+        is False. For process pools ``func`` must be picklable.
+        """
+        if executor is not None or workers is not None:
+            return self._extend(ParallelMap(func, executor, workers, chunksize, ordered))
+        if asyncio.iscoroutinefunction(func):
+            return self._extend(AsyncMap(func))
+        return self._extend(Map(func))
+
+    def distinct(self, key=None, max_items=None, error_rate=0.001):
+        """
+        Yield every item that wasn't seen before, compared by their content or by ``key``,
+        which is either a function or the name of a field. Only fingerprints of the items are kept, values that
+        aren't JSON-like have to be hashable and are kept themselves. If ``max_items`` is set, a Bloom filter
+        sized for that many items is used instead, which needs constant memory but skips unseen items with a
+        probability of ``error_rate``, and ``key`` has to return JSON-like values.
+        """
+        return self._extend(Distinct(key, max_items, error_rate))
+
+    def take(self, n):
+        """Yield only the first ``n`` items, the source isn't consumed any further."""
+        return self._extend(Take(n))
+
+    def skip(self, n):
+        return self._extend(Skip(n))
+
+    def batch(self, size):
+        """Group the items into lists of ``size`` items, the last list may be shorter."""
+        return self._extend(Batch(size))
+
+    chunked = batch
+
+
+def _write_run(items, apis):
+    # resources are stored without their API, which is kept in memory and restored when reading
+    run = tempfile.TemporaryFile()
+    for item in items:
+        if isinstance(item, (ResourceObject, ResourceRecord)):
+            if item.api not in apis:
+                apis.append(item.api)
+            api = apis.index(item.api)
+        else:
+            api = None
+        if isinstance(item, ResourceObject):
+            record = (True, item.data, api)
+        else:
+            record = (False, item, api)
+        pickle.dump(record, run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _read_run(run, apis):
+    while True:
+        try:
+            is_resource, item, api = pickle.load(run)
+        except EOFError:
+            return
+        if is_resource:
+            yield ResourceObject(item, apis[api])
+            continue
+        if api is not None:
+            item.api = apis[api]
+        yield item
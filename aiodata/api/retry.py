@@ -0,0 +1,40 @@
+import random
+import asyncio
+import aiohttp
+
+
+class RetryPolicy:
+    """
+    Decides which failed requests APISession retries and how long it waits in between.
+    Requests are retried on the given response ``statuses`` and ``exceptions`` if their method is
+    in ``methods`` (the idempotent ones by default), up to ``max_attempts`` attempts in total.
+    The delay grows exponentially from ``backoff`` up to ``max_backoff`` seconds, with full jitter
+    if ``jitter`` is set, and is at least as long as the ``Retry-After`` header of the response.
+    """
+
+    def __init__(self, max_attempts=3, statuses=(429, 500, 502, 503, 504),
+                 exceptions=(aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError),
+                 methods=("GET", "HEAD", "OPTIONS", "PUT", "DELETE"), backoff=0.5, max_backoff=30.0, jitter=True):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+        self.max_attempts = max_attempts
+        self.statuses = frozenset(statuses)
+        self.exceptions = tuple(exceptions)
+        self.methods = frozenset(m.upper() for m in methods)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def retry_status(self, method, status, attempt):
+        return attempt < self.max_attempts and method.upper() in self.methods and status in self.statuses
+
+    def retry_exception(self, method, exception, attempt):
+        return attempt < self.max_attempts and method.upper() in self.methods and isinstance(exception, self.exceptions)
+
+    def delay(self, attempt, retry_after=None):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
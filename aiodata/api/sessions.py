@@ -3,15 +3,24 @@ try:
 except ImportError:
     import json
 
+import asyncio
+import collections
 import aiohttp
 import aiofiles
 import yaml
+from multidict import CIMultiDict
 from typing import Optional, Union, Iterable
+from pathlib import Path
 from urllib.parse import urljoin
 from functools import reduce
 from .resource import ResourceIterable, ResourceObject
-from ..utils import returns, get_content_type
+from .pagination import Pagination, paginate
+from .cache import Cache
+from .throttle import RateLimiter, parse_retry_after
+from .retry import RetryPolicy
+from ..utils import returns, chain, get_content_type
 from .spec import OpenAPISpec
+from .spec.cache import SpecCache, CachedSpec
 from .spec.base import Spec, Endpoint
 import xmltodict
 import logging
@@ -20,26 +29,61 @@ import logging
 class APISession:
 
     def __init__(self, base_url: Optional[str] = None, api_spec: Optional[Spec] = None,
-                 session: Optional[aiohttp.ClientSession] = None):
+                 session: Optional[aiohttp.ClientSession] = None, cache: Optional[Cache] = None,
+                 coalesce: bool = False, rate_limiter: Optional[RateLimiter] = None,
+                 retry: Optional[RetryPolicy] = None):
         self.logger = logging.getLogger(__name__)
         if session is None:
             session = aiohttp.ClientSession(json_serialize=json.dumps)
         self.session = session
+        self.cache = cache
+        self.coalesce = coalesce
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.stats = collections.Counter()
+        self._in_flight = {}
+        self.spec = api_spec
         if api_spec is not None:
-            self.spec = api_spec
             base_url = api_spec.api_url
         self.base_url = base_url
 
     @classmethod
-    async def from_url(cls, spec_url, session=None):
+    async def from_url(cls, spec_url, session=None, cache_dir=None, max_age=None):
+        """
+        Create a session from the OpenAPI spec at ``spec_url``. If ``cache_dir`` is given, the compiled spec
+        is cached on disk and reused while the ETag or content of the spec is unchanged. Cached specs younger
+        than ``max_age`` seconds are used without any request.
+        """
+        spec_cache = SpecCache(cache_dir) if cache_dir is not None else None
+        cached = spec_cache.load(spec_url) if spec_cache is not None else None
+
+        if cached is not None and max_age is not None and cached.age < max_age:
+            return cls(api_spec=cached.spec)
+
+        headers = {aiohttp.hdrs.IF_NONE_MATCH: cached.etag} if cached is not None and cached.etag else None
+
         async with session or aiohttp.ClientSession() as ses:
-            async with ses.get(spec_url) as ret:
-                return cls(api_spec=OpenAPISpec(await cls._parse_response(ret), spec_url, session))
+            async with ses.get(spec_url, headers=headers) as ret:
+                etag = ret.headers.get(aiohttp.hdrs.ETAG)
+                if ret.status == 304 and cached is not None:
+                    spec, content_hash = cached.spec, cached.content_hash
+                else:
+                    content_hash = SpecCache.content_hash(await ret.read())
+                    if cached is not None and cached.content_hash == content_hash:
+                        spec = cached.spec
+                    else:
+                        spec = await OpenAPISpec.load(await cls._parse_response(ret), spec_url, ses)
+
+        if spec_cache is not None:
+            spec_cache.store(spec_url, CachedSpec(spec, etag, content_hash))
+        return cls(api_spec=spec)
 
     @classmethod
     async def from_filename(cls, filename):
         async with aiofiles.open(filename) as f:
-            return cls(api_spec=yaml.safe_load(await f.read()))
+            spec_dict = yaml.safe_load(await f.read())
+        # relative references are resolved against the location of the file
+        return cls(api_spec=await OpenAPISpec.load(spec_dict, Path(filename).resolve().as_uri()))
 
     @staticmethod
     async def _parse_response(response):
@@ -56,13 +100,113 @@ class APISession:
             return await response.text()
         return response
 
-    async def request(self, method, url, params=None, json=None, file=None):
+    async def request(self, method, url, params=None, json=None, file=None, headers=None):
+        data, _ = await self.fetch(method, url, params=params, json=json, file=file, headers=headers)
+        return data
+
+    async def fetch(self, method, url, params=None, json=None, file=None, headers=None):
+        """Like request, but returns the response headers along with the parsed response."""
+        if self.coalesce and method.upper() == "GET":
+            return await self._coalesced_fetch(url, params, headers)
+        return await self._fetch(method, url, params, json, file, headers)
+
+    async def _coalesced_fetch(self, url, params=None, headers=None):
+        # concurrent identical GETs share one request, every caller gets the same parsed response
+        key = Cache.key("GET", url, params), tuple(sorted((headers or {}).items()))
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch("GET", url, params, headers=headers))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._in_flight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # a cancelled caller must not cancel the request of the others
+        return await asyncio.shield(future)
+
+    async def _fetch(self, method, url, params=None, json=None, file=None, headers=None):
+        if self.cache is not None and method.upper() == "GET":
+            return await self._cached_fetch(url, params, headers)
+        _, data, response_headers = await self._send(method, url, params, json, file, headers)
+        return data, response_headers
+
+    async def _cached_fetch(self, url, params=None, headers=None):
+        key = self.cache.key("GET", url, params)
+        entry = await self.cache.get(key)
+
+        if entry is not None and entry.fresh:
+            self.cache.stats["hits"] += 1
+            return entry.data, entry.headers
+
+        if entry is not None and entry.revalidatable:
+            headers = dict(headers or {})
+            if entry.etag is not None:
+                headers[aiohttp.hdrs.IF_NONE_MATCH] = entry.etag
+            if entry.last_modified is not None:
+                headers[aiohttp.hdrs.IF_MODIFIED_SINCE] = entry.last_modified
+
+        status, data, response_headers = await self._send("GET", url, params, headers=headers)
+
+        if status == 304 and entry is not None:
+            self.cache.stats["revalidated"] += 1
+            # a 304 may omit the headers of the original response, the stored ones are kept unless it sends new ones
+            headers = CIMultiDict(entry.headers)
+            for name in (aiohttp.hdrs.CACHE_CONTROL, aiohttp.hdrs.ETAG, aiohttp.hdrs.LAST_MODIFIED):
+                if name in response_headers:
+                    headers[name] = response_headers[name]
+            new_entry = self.cache.entry_from_response(entry.data, headers)
+            if new_entry is not None:
+                await self.cache.set(key, new_entry)
+            return entry.data, headers
+
+        self.cache.stats["misses"] += 1
+        if not isinstance(data, aiohttp.ClientResponse):
+            new_entry = self.cache.entry_from_response(data, response_headers)
+            if new_entry is not None:
+                await self.cache.set(key, new_entry)
+        return data, response_headers
+
+    async def _send(self, method, url, params=None, json=None, file=None, headers=None):
         if file is not None:
             data = {'file': file}
         else:
             data = None
-        async with self.session.request(method, url, params=params, data=data, json=json) as response:
-            return await self._parse_response(response)
+        retry = self.retry
+        position = None
+        if hasattr(file, "read"):
+            # a retry has to send the file again from where the first attempt started
+            seekable = getattr(file, "seekable", None)
+            if seekable is not None and seekable():
+                position = file.tell()
+            else:
+                retry = None
+        attempt = 1
+        while True:
+            if attempt > 1 and position is not None:
+                file.seek(position)
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(url)
+            try:
+                async with self.session.request(method, url, params=params, data=data, json=json,
+                                                headers=headers) as response:
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.update(url, response.status, response.headers)
+                    if retry is not None and retry.retry_status(method, response.status, attempt):
+                        delay = retry.delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                        reason = f"status {response.status}"
+                    elif response.status == 304:
+                        return response.status, None, CIMultiDict(response.headers)
+                    else:
+                        return response.status, await self._parse_response(response), CIMultiDict(response.headers)
+            except Exception as e:
+                if retry is None or not retry.retry_exception(method, e, attempt):
+                    raise
+                delay = retry.delay(attempt)
+                reason = repr(e)
+
+            self.stats["retries"] += 1
+            self.logger.debug(f"Retrying {method} {url} in {delay:.2f}s after {reason} (attempt {attempt})")
+            await asyncio.sleep(delay)
+            attempt += 1
 
     async def close(self):
         await self.session.close()
@@ -71,12 +215,15 @@ class APISession:
         return f"{self.__class__.__name__}({self.base_url})"
 
     def __getattr__(self, name):
-        if self.spec is None:
-            return super(APISession, self).__getattr__(name)
-        endpoint = self.spec.endpoints.get(name)
+        if name.startswith("_") or self.__dict__.get("spec") is None:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+        endpoints = self.spec.endpoints
+        endpoint = endpoints.get(name) or endpoints.get("/" + name)
         if not endpoint:
             raise AttributeError(f"No endpoint '{name}'")
-        return API(session=self, endpoint=endpoint)
+        # cache the API on the instance so the next lookup doesn't reach __getattr__
+        api = self.__dict__[name] = API(session=self, endpoint=endpoint)
+        return api
 
     def __dir__(self):
         return super().__dir__() + list((self.spec or []) and self.spec.endpoints.keys())
@@ -84,13 +231,20 @@ class APISession:
 
 class API:
 
-    def __init__(self, session: APISession, endpoint: Union[str, Endpoint], model=None):
+    def __init__(self, session: APISession, endpoint: Union[str, Endpoint], model=None, record_class=None):
         self.session = session
         self.endpoint = endpoint
         self.model = model
+        self.record_class = record_class
+
+    def _wrap(self, data):
+        """Wrap returned data in a ResourceObject or, if the API has a record_class, in a compact record."""
+        if self.record_class is not None:
+            return self.record_class(data, api=self)
+        return ResourceObject(data=data, api=self)
 
     def make_url(self, *args: str):
-        fragments = [self.session.base_url, self.endpoint]
+        fragments = [self.session.base_url, str(self.endpoint)]
         fragments += [a.strip("/") for a in args]
         return reduce(urljoin, fragments)
 
@@ -108,45 +262,57 @@ class API:
 
     async def get_by_id(self, uid):
         ret = await self.get(uid)
-        return ResourceObject(data=ret, api=self)
+        return self._wrap(ret)
 
     @returns(ResourceIterable)
-    async def create_multiple(self, data: Iterable[dict]):
-        items = ResourceIterable([ResourceObject(data=d, api=self) for d in data])
-        async for item in items.create():
+    async def create_multiple(self, data: Iterable[dict], max_concurrency=100, ordered=False):
+        items = ResourceIterable(self._wrap(d) for d in data)
+        async for item in items.create(max_concurrency, ordered):
             yield item
 
     @returns(ResourceIterable)
-    async def list(self):
-        items = await self.get()
-        for item in items:
-            yield ResourceObject(data=item, api=self)
+    async def list(self, pagination: Optional[Pagination] = None, prefetch=0, **params):
+        if pagination is None and not isinstance(self.endpoint, str):
+            pagination = self.endpoint.pagination
+        if pagination is None:
+            items = await self.get(**params)
+        else:
+            items = paginate(self.session, self.make_url(), pagination, params, prefetch)
+        async for item in chain(items):
+            yield self._wrap(item)
 
     def create_sub_api(self, path:str):
-        return API(self.session, "/".join([str(self.endpoint).rstrip("/"), path.lstrip("/")]))
+        return API(self.session, "/".join([str(self.endpoint).rstrip("/"), path.lstrip("/")]),
+                   record_class=self.record_class)
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.endpoint})"
 
     def __getattr__(self, name):
-        if isinstance(self.endpoint, str):
-            return super(API, self).__getattr__(name)
+        if name.startswith("_") or isinstance(self.__dict__.get("endpoint", ""), str):
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
 
-        operation = getattr(self.endpoint, name, None)
+        operation = self.endpoint.operations.get(name)
         if not operation:
             raise AttributeError(f"No operation {name}")
 
+        base_url = self.session.base_url.rstrip("/")
+        http_method = operation.http_method
+
         async def call_operation(**kwargs):
-            url = self.make_url(operation.path_name)
-            ret = await self.session.request(str(operation.http_method.upper()), url, **kwargs)
+            path_params = {p: kwargs.pop(p) for p in operation.path_parameters if p in kwargs}
+            url = base_url + operation.format_path(**path_params)
+            ret = await self.session.request(http_method, url, **kwargs)
             if isinstance(ret, list):
-                return ResourceIterable(ResourceObject(data=item, api=self) for item in ret)
-            return ResourceObject(data=ret, api=self)
+                return ResourceIterable(self._wrap(item) for item in ret)
+            return self._wrap(ret)
 
+        # cache the bound operation on the instance so the next call doesn't reach __getattr__
+        self.__dict__[name] = call_operation
         return call_operation
 
     def __dir__(self):
         d = super().__dir__()
         if isinstance(self.endpoint, str):
             return d
-        return d + dir(self.endpoint)
+        return d + list(self.endpoint.operations)
@@ -1,2 +1,3 @@
 from .openapi import OpenAPISpec
 from .base import FieldType
+from .cache import SpecCache
@@ -51,6 +51,10 @@ class Endpoint(ABC):
     def operations(self):
         pass
 
+    @property
+    def pagination(self):
+        return None
+
 
 class Operation(ABC):
 
@@ -58,6 +62,10 @@ class Operation(ABC):
         self.method = method
         self.spec_dict = spec_dict
 
+    @property
+    def pagination(self):
+        return None
+
 
 class FieldType(Enum):
     STRING = auto()
@@ -0,0 +1,57 @@
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+
+
+class CachedSpec:
+
+    def __init__(self, spec, etag=None, content_hash=None, fetched=None):
+        self.spec = spec
+        self.etag = etag
+        self.content_hash = content_hash
+        self.fetched = fetched or time.time()
+
+    @property
+    def age(self):
+        return time.time() - self.fetched
+
+
+class SpecCache:
+    """
+    On-disk cache of compiled specs in ``directory``, one pickle file per spec URL.
+    Entries are validated by the ETag of the spec or the hash of its content.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def content_hash(content: bytes):
+        return hashlib.sha256(content).hexdigest()
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".pickle")
+
+    def load(self, url):
+        try:
+            with open(self._path(url), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # a corrupt or outdated cache file is treated like a miss
+            return None
+
+    def store(self, url, cached: CachedSpec):
+        # write to a temporary file first so concurrent workers never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(cached, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(url))
+        except BaseException:
+            os.remove(tmp)
+            raise
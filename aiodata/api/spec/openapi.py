@@ -1,39 +1,60 @@
-import aiohttp
 import yaml
 import json
 from contextlib import closing
 from urllib.request import urlopen
-from urllib.parse import urlparse, urlunparse
+from string import Formatter
+from types import MappingProxyType
+from urllib.parse import urlparse, urlunparse, quote
 from .base import Spec, Model, Field, Operation, Endpoint, FieldType
 from openapi_spec_validator import validate_spec
 from jsonschema.validators import RefResolver
+from jsonschema.exceptions import RefResolutionError
+from .refs import resolve_references
+from ..pagination import detect_pagination
+from ..resource import make_record_class
 from ...utils import get_content_type
 
+http_methods = frozenset(("get", "put", "post", "delete", "options", "head", "patch", "trace"))
+
 type_mapping = {
     "string": FieldType.STRING,
     "integer": FieldType.INTEGER,
     "number": FieldType.DECIMAL,
     "array": FieldType.ARRAY,
-    "boolean": FieldType.BOOLEAN
+    "boolean": FieldType.BOOLEAN,
+    "object": FieldType.OBJECT
 }
 
 
 class OpenAPISpec(Spec):
 
-    def __init__(self, spec_dict, spec_url=None, session=None):
+    def __init__(self, spec_dict, spec_url=None, documents=None):
         self.spec_url = spec_url
 
-        if session is None:
-            session = aiohttp.ClientSession()
+        self.resolver = self._create_resolver(spec_dict, spec_url, documents)
+
+        # validate_spec(spec_dict, spec_url=spec_url or "")
+
+        self.models = {name: OpenAPIModel(fragment) for name, fragment in spec_dict["definitions"].items()}
+
+        super(OpenAPISpec, self).__init__(spec_dict)
 
+        # compile the spec once, attribute-style calls are plain dict lookups afterwards
+        self._endpoints = MappingProxyType({path: OpenAPIEndpoint(spec, path)
+                                            for path, spec in spec_dict["paths"].items()})
+        self.operations = MappingProxyType({op_id: op for endpoint in self._endpoints.values()
+                                            for op_id, op in endpoint.operations.items()})
+
+    @classmethod
+    async def load(cls, spec_dict, spec_url=None, session=None):
+        """Create the spec after loading all external references concurrently."""
+        resolved, documents = await resolve_references(spec_dict, spec_url, session)
+        return cls(resolved, spec_url, documents)
+
+    @staticmethod
+    def _create_resolver(spec_dict, spec_url=None, store=None):
         def get(uri):
-            async def a_get(url):
-                ret = await session.get(url)
-                if get_content_type(ret.headers.get(aiohttp.hdrs.CONTENT_TYPE, ""), url) == "yaml":
-                    return yaml.safe_load(await ret.text())
-                else:
-                    return await ret.json()
-            return session.loop.run_until_complete(a_get(uri))
+            raise RefResolutionError(f"Remote reference '{uri}' was not loaded, create the spec with OpenAPISpec.load")
 
         def read_file(uri):
             with closing(urlopen(uri)) as f:
@@ -48,41 +69,102 @@ class OpenAPISpec(Spec):
             "file": read_file
         }
 
-        self.resolver = RefResolver(base_uri=spec_url or "", referrer=spec_dict, handlers=handlers)
+        return RefResolver(base_uri=spec_url or "", referrer=spec_dict, store=store or {}, handlers=handlers)
 
-        # validate_spec(spec_dict, spec_url=spec_url or "")
+    def __getstate__(self):
+        # the resolver holds local functions, only the documents it loaded are kept
+        state = self.__dict__.copy()
+        state["resolver"] = dict(self.resolver.store)
+        state["_endpoints"] = dict(self._endpoints)
+        state["operations"] = dict(self.operations)
+        return state
 
-        self.models = {name: OpenAPIModel(fragment) for name, fragment in spec_dict["definitions"].items()}
-
-        super(OpenAPISpec, self).__init__(spec_dict)
+    def __setstate__(self, state):
+        store = state.pop("resolver")
+        state["_endpoints"] = MappingProxyType(state["_endpoints"])
+        state["operations"] = MappingProxyType(state["operations"])
+        self.__dict__.update(state)
+        self.resolver = self._create_resolver(self.spec_dict, self.spec_url, store=store)
 
     @property
     def api_url(self):
-        url = urlparse(self.spec_url or "http://localhost")
+        url = urlparse(self.spec_url or "")
+        if url.scheme not in ("http", "https"):
+            # the URI of a spec loaded from a file is only used to resolve references
+            url = urlparse("http://localhost")
         netloc = self.spec_dict.get('host', url.netloc)
-        path = self.spec_dict.get('basePath', url.path)
+        # without a basePath the API is served at the root of the host, not at the path of the spec
+        path = self.spec_dict.get('basePath', '/')
         schemes = self.spec_dict.get('schemes')
         scheme = url.scheme if not schemes or url.scheme in schemes else schemes[0]
         return urlunparse((scheme, netloc, path, None, None, None))
 
     @property
     def endpoints(self):
-        return {path: OpenAPIEndpoint(spec) for path, spec in self.spec_dict["paths"].items()}
+        return self._endpoints
 
 
 class OpenAPIEndpoint(Endpoint):
 
+    def __init__(self, spec_dict, path=None):
+        super(OpenAPIEndpoint, self).__init__(spec_dict)
+        self.path = path
+        parameters = spec_dict.get("parameters", [])
+        self.methods = MappingProxyType({method: OpenAPIOperation(method, op, path, parameters)
+                                         for method, op in spec_dict.items() if method in http_methods})
+        self._operations = MappingProxyType({op.spec_dict.get("operationId", method): op
+                                             for method, op in self.methods.items()})
+
     @property
     def model(self):
         return OpenAPIModel({"properties":{}})
 
     @property
     def operations(self):
-        return {op.get("operationId", method): OpenAPIOperation(method, op) for method, op in self.spec_dict.items()}
+        return self._operations
+
+    @property
+    def pagination(self):
+        operation = self.methods.get("get")
+        return operation.pagination if operation is not None else None
+
+    def __str__(self):
+        return self.path or ""
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["methods"] = dict(self.methods)
+        state["_operations"] = dict(self._operations)
+        return state
+
+    def __setstate__(self, state):
+        state["methods"] = MappingProxyType(state["methods"])
+        state["_operations"] = MappingProxyType(state["_operations"])
+        self.__dict__.update(state)
 
 
 class OpenAPIOperation(Operation):
-    pass
+
+    def __init__(self, method, spec_dict, path=None, path_item_parameters=()):
+        super(OpenAPIOperation, self).__init__(method, spec_dict)
+        self.http_method = method.upper()
+        self.path_name = path or ""
+        self.parameters = list(path_item_parameters) + spec_dict.get("parameters", [])
+        # pre-parse the URL template, e.g. /pets/{petId}
+        self.path_template = [(literal, field) for literal, field, _, _ in Formatter().parse(self.path_name)]
+        self.path_parameters = tuple(field for _, field in self.path_template if field)
+        query = [p for p in self.parameters if p.get("in") == "query"]
+        self._pagination = detect_pagination(query) if method == "get" else None
+
+    @property
+    def pagination(self):
+        return self._pagination
+
+    def format_path(self, **path_params):
+        if not self.path_parameters:
+            return self.path_name
+        return "".join(literal + (quote(str(path_params[field]), safe="") if field else "")
+                       for literal, field in self.path_template)
 
 
 class OpenAPIModel(Model):
@@ -93,4 +175,10 @@ class OpenAPIModel(Model):
 
     @property
     def fields(self):
-        return [Field(name, type_mapping[spec["type"]]) for name, spec in self.spec_dict["properties"].items()]
+        # properties without a type are references to other schemas
+        return [Field(name, type_mapping.get(spec.get("type"), FieldType.OBJECT))
+                for name, spec in self.spec_dict["properties"].items()]
+
+    def record_class(self, name="Record"):
+        """Create a compact record class with a slot for every field of the model."""
+        return make_record_class(name, self.fields)
@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+import aiohttp
+import aiofiles
+import yaml
+from urllib.parse import urljoin, urldefrag, urlparse, unquote
+from ...utils import get_content_type
+
+
+async def resolve_references(spec_dict, spec_url=None, session=None):
+    """
+    Load every document referenced by an external ``$ref`` of the spec concurrently, following
+    references in the loaded documents as well. Every document is fetched only once.
+    Returns the spec with the external references substituted and a dict of the loaded documents.
+    References that are part of a cycle are kept as absolute references to the loaded documents.
+    """
+    root_url = spec_url or ""
+    documents = {root_url: spec_dict}
+    tasks = {}
+
+    async with _optional_session(session) as ses:
+
+        def schedule(document, base):
+            for ref in _iter_refs(document):
+                doc_url = urldefrag(urljoin(base, ref))[0] or base
+                if doc_url not in documents and doc_url not in tasks:
+                    tasks[doc_url] = asyncio.ensure_future(_load_document(ses, doc_url))
+
+        schedule(spec_dict, root_url)
+        pending = {task: url for url, task in tasks.items()}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    doc_url = pending.pop(task)
+                    documents[doc_url] = task.result()
+                    schedule(documents[doc_url], doc_url)
+                pending.update({task: url for url, task in tasks.items() if url not in documents and task not in pending})
+        finally:
+            for task in pending:
+                task.cancel()
+
+    memo = {}
+
+    def substitute(node, base, stack):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str):
+                uri = urljoin(base, ref)
+                doc_url, fragment = urldefrag(uri)
+                doc_url = doc_url or base
+                if doc_url != root_url:
+                    uri = f"{doc_url}#{fragment}"
+                    if uri in stack:
+                        # recursive schema, left to the RefResolver which has the document in its store
+                        return {"$ref": uri}
+                    if uri not in memo:
+                        target = resolve_pointer(documents[doc_url], fragment)
+                        memo[uri] = substitute(target, doc_url, stack | {uri})
+                    return memo[uri]
+                if base != root_url:
+                    # a reference from another document back into the spec
+                    return {"$ref": f"#{fragment}"}
+            return {k: substitute(v, base, stack) for k, v in node.items()}
+        if isinstance(node, list):
+            return [substitute(v, base, stack) for v in node]
+        return node
+
+    resolved = substitute(spec_dict, root_url, frozenset())
+    del documents[root_url]
+    return resolved, documents
+
+
+def resolve_pointer(document, fragment):
+    """Resolve a JSON pointer such as ``/definitions/Pet``."""
+    for part in unquote(fragment).split("/")[1:]:
+        part = part.replace("~1", "/").replace("~0", "~")
+        if isinstance(document, list):
+            document = document[int(part)]
+        else:
+            document = document[part]
+    return document
+
+
+def _iter_refs(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and not ref.startswith("#"):
+                yield ref
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+
+async def _load_document(session, url):
+    scheme = urlparse(url).scheme
+    if scheme in ("http", "https"):
+        async with session.get(url) as response:
+            response.raise_for_status()
+            text = await response.text()
+            content_type = get_content_type(response.headers.get(aiohttp.hdrs.CONTENT_TYPE, ""), url)
+    else:
+        path = unquote(urlparse(url).path) if scheme == "file" else url
+        async with aiofiles.open(os.path.normpath(path), encoding="utf-8") as f:
+            text = await f.read()
+        content_type = get_content_type(url=url)
+    if content_type == "json":
+        return json.loads(text)
+    return yaml.safe_load(text)
+
+
+class _optional_session:
+
+    def __init__(self, session):
+        self.session = session
+        self.owned = session is None
+
+    async def __aenter__(self):
+        if self.owned:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        if self.owned:
+            await self.session.close()
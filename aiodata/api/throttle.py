@@ -0,0 +1,146 @@
+import time
+import asyncio
+import collections
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Token bucket that allows ``rate`` requests per second with bursts of up to ``capacity`` requests.
+    The rate is adjusted between ``min_rate`` and the initial rate based on the responses of the server.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 100
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Don't hand out tokens for the next ``seconds`` seconds."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        # refill from the end of the pause, not for the paused interval
+        self.updated = self.blocked_until
+
+    def slow_down(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def limit(self, rate):
+        self.rate = max(self.min_rate, min(self.max_rate, rate))
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter for APISession.
+    ``rate`` and ``burst`` apply to the whole session, or to every host if ``per_host`` is set.
+    ``limits`` maps hosts or URL prefixes to ``rate`` or ``(rate, burst)`` tuples for individual endpoints.
+    If ``adaptive`` is set, the rate is halved on 429 responses, follows ``Retry-After`` and
+    ``X-RateLimit-*`` headers and slowly recovers after successful requests.
+    """
+
+    def __init__(self, rate, burst=None, per_host=False, limits=None, adaptive=True):
+        self.rate = rate
+        self.burst = burst
+        self.per_host = per_host
+        self.adaptive = adaptive
+        self.limits = {}
+        for prefix, limit in (limits or {}).items():
+            self.limits[prefix] = limit if isinstance(limit, tuple) else (limit, None)
+        # longest prefixes first so the most specific limit wins
+        self._prefixes = sorted(self.limits, key=len, reverse=True)
+        self.buckets = {}
+        self.stats = collections.Counter()
+
+    def _bucket_key(self, url):
+        url = str(url)
+        for prefix in self._prefixes:
+            if url.startswith(prefix) or urlparse(url).netloc == prefix:
+                return prefix
+        return urlparse(url).netloc if self.per_host else None
+
+    def bucket(self, url):
+        key = self._bucket_key(url)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate, burst = self.limits.get(key, (self.rate, self.burst))
+            bucket = self.buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, url):
+        bucket = self.bucket(url)
+        start = time.monotonic()
+        await bucket.acquire()
+        self.stats["requests"] += 1
+        self.stats["wait_time"] += time.monotonic() - start
+
+    def update(self, url, status, headers):
+        if not self.adaptive:
+            return
+        bucket = self.bucket(url)
+
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        if status == 429 or (status == 503 and retry_after is not None):
+            self.stats["throttled"] += 1
+            bucket.slow_down()
+            if retry_after is not None:
+                bucket.pause(retry_after)
+            return
+
+        remaining = _to_float(headers.get("X-RateLimit-Remaining"))
+        reset = _to_float(headers.get("X-RateLimit-Reset"))
+        if remaining is not None and reset is not None:
+            # the reset is either a unix timestamp or a number of seconds
+            seconds = reset - time.time() if reset > 1e9 else reset
+            if remaining < 1:
+                bucket.pause(max(seconds, 0))
+            elif seconds > 0:
+                # spread the remaining quota over the rest of the window
+                bucket.limit(remaining / seconds)
+            return
+
+        if status < 400:
+            bucket.speed_up()
+
+
+def parse_retry_after(value):
+    """Return the number of seconds of a ``Retry-After`` header, which is either a number or an HTTP date."""
+    if value is None:
+        return None
+    seconds = _to_float(value)
+    if seconds is not None:
+        return max(seconds, 0.0)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,8 +1,10 @@
+import json
 from contextlib import contextmanager
 from sqlalchemy.schema import MetaData, CreateTable, DropTable
 from sqlalchemy import Table, Column, PrimaryKeyConstraint
 from sqlalchemy.types import BigInteger, Integer, Float, Text, Boolean, DateTime, Date, Time
 from ..api.spec import FieldType
+from ..utils import batched, chain
 
 
 async def create_table(model, name, engine, schema=None, if_exists='fail'):
@@ -46,6 +48,9 @@ class SQLDatabase:
             else:
                 yield self.engine
 
+    def connect(self):
+        return self.engine.connect()
+
     def execute(self, *args, **kwargs):
         """Simple passthrough to SQLAlchemy connectable"""
         return self.engine.execute(*args, **kwargs)
@@ -107,6 +112,7 @@ class SQLTable:
         self.schema = schema
         self.if_exists = if_exists
         self.keys = keys
+        self._compiled_insert = None
 
         if model is not None:
             # We want to initialize based on a model
@@ -155,6 +161,52 @@ class SQLTable:
         async with self.db.connect() as connection:
             await connection.execute(query)
 
+    def _compile_insert(self):
+        if self._compiled_insert is None:
+            compiled = self.table.insert().compile(dialect=self.db.engine.dialect)
+            if compiled.positional:
+                columns = list(compiled.positiontup)
+            else:
+                columns = [c.name for c in self.table.columns]
+            # ARRAY and OBJECT fields are stored as JSON in text columns
+            json_columns = {c.name for c in self.table.columns if isinstance(c.type, Text)}
+            self._compiled_insert = str(compiled), columns, compiled.positional, json_columns
+        return self._compiled_insert
+
+    async def insert_many(self, rows, batch_size=1000):
+        """
+        Insert rows (dicts) in batches of ``batch_size``, compiling the INSERT statement only once.
+        If ``batch_size`` is None, ``rows`` is a list that is inserted as one batch.
+        With asyncpg (postgres) each batch is loaded using the COPY protocol,
+        other drivers use executemany. Lists and dicts of ARRAY and OBJECT fields
+        are inserted as JSON text. Returns the number of inserted rows.
+        """
+        query, columns, positional, json_columns = self._compile_insert()
+        schema = self.schema or self.db.meta.schema
+        count = 0
+
+        def values(row):
+            return [json.dumps(v) if c in json_columns and isinstance(v, (list, dict)) else v
+                    for c, v in zip(columns, map(row.get, columns))]
+
+        batches = batched(rows, batch_size) if batch_size is not None else chain([rows])
+        async for batch in batches:
+            if positional or self.db.engine.driver == "psycopg2":
+                records = [tuple(values(row)) for row in batch]
+            else:
+                records = [dict(zip(columns, values(row))) for row in batch]
+
+            async with self.db.connect() as connection:
+                if self.db.engine.driver == "psycopg2":
+                    await connection.copy_records_to_table(self.name, records=records, columns=columns,
+                                                           schema_name=schema)
+                else:
+                    await connection.executemany(query, records)
+
+            count += len(records)
+
+        return count
+
     def _get_column_names_and_types(self):
         field_type_mapping = {
             FieldType.BOOLEAN: Boolean,
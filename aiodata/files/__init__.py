@@ -1,3 +1,3 @@
-from .csv import read_csv
-from .xml import read_xml
-from .json import read_json
+from .csv import read_csv, write_csv
+from .xml import read_xml, write_xml
+from .json import read_json, stream_json, write_json
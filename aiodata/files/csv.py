@@ -1,28 +1,188 @@
 import pandas as pd
 import asyncio
-import janus
+import csv
+import io
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pandas.io.common import _infer_compression
+from ..utils import open_file, open_output, iterate_in_thread, write_in_thread, RemoteFile, is_url, map_concurrent
 
 
-async def read_csv(filepath_or_buffer, chunksize=10000, loop=None, executor=None, **kwargs):
+async def read_csv(filepath_or_buffer, chunksize=10000, yield_chunks=False, max_chunks=4, decompress_threads=1,
+                   workers=None, shard_size=64*1024*1024, ordered=True, session=None, loop=None, executor=None,
+                   **kwargs):
+    """
+    Parse a CSV file in chunks of ``chunksize`` rows in an executor thread, which blocks while
+    ``max_chunks`` chunks are waiting to be consumed.
+    By default every row is yielded as a dict. With ``yield_chunks=True`` whole DataFrames are yielded
+    and with ``yield_chunks="columns"`` every chunk is yielded as a dict of column lists.
+    ``filepath_or_buffer`` can also be a URL or an aiohttp response, which is decompressed and parsed
+    while it is downloaded, see ``RemoteFile``. BGZF files are inflated with ``decompress_threads`` threads,
+    see ``open_file``; pandas' own ``memory_map`` option can be passed for uncompressed files.
+
+    If ``workers`` is given or ``executor`` is a ProcessPoolExecutor, an uncompressed local file is split
+    into shards of about ``shard_size`` bytes that end on record boundaries, which are parsed in parallel
+    processes. The chunks are yielded in file order unless ``ordered`` is False.
+    """
+    if yield_chunks not in (True, False, "columns"):
+        raise ValueError(f"'{yield_chunks}' is not valid for yield_chunks")
 
     if loop is None:
         loop = asyncio.get_event_loop()
 
-    queue = janus.Queue(loop=loop)
+    if workers is not None or isinstance(executor, ProcessPoolExecutor):
+        chunks = _read_sharded(filepath_or_buffer, chunksize, workers, shard_size, ordered, loop, executor, kwargs)
+        async for chunk in chunks:
+            for item in _chunk_items(chunk, yield_chunks):
+                yield item
+        return
+
+    async with RemoteFile(filepath_or_buffer, kwargs.pop("compression", "infer"), session, loop=loop) as source:
+
+        def produce(emit):
+            if source.is_remote or decompress_threads > 1:
+                with open_file(source.file, mode="rb", compression=source.compression,
+                               decompress_threads=decompress_threads) as f:
+                    for chunk in pd.read_csv(f, chunksize=chunksize, **kwargs):
+                        emit(chunk)
+            else:
+                for chunk in pd.read_csv(source.file, chunksize=chunksize, compression=source.compression, **kwargs):
+                    emit(chunk)
+
+        async for batch in iterate_in_thread(produce, 1, None, max_chunks, loop, executor):
+            for item in _chunk_items(batch[0], yield_chunks):
+                yield item
+
+
+async def write_csv(iterable, path, columns=None, compression="infer", encoding="utf-8", batch_size=1000,
+                    max_batches=8, buffer_size=1024*1024, loop=None, executor=None, **kwargs):
+    """
+    Write the items of a sync or async iterable, e.g. a ``ResourceIterable``, as rows of a CSV file with a header.
+    The columns are ``columns`` or the keys of the first item, other keyword arguments are passed to
+    ``csv.DictWriter``. Rows are serialised in an executor thread, see ``write_in_thread``, and written in
+    blocks of ``buffer_size`` bytes, see ``open_output``. Returns the number of written rows.
+    """
+
+    def consume(batches):
+        n = 0
+        with open_output(path, "w", encoding, compression, buffer_size) as f:
+            writer = None
+            for batch in batches:
+                rows = [getattr(item, "data", item) for item in batch]
+                if writer is None:
+                    writer = csv.DictWriter(f, columns or list(rows[0]), **kwargs)
+                    writer.writeheader()
+                writer.writerows(rows)
+                n += len(rows)
+            if writer is None and columns:
+                csv.DictWriter(f, columns, **kwargs).writeheader()
+        return n
+
+    return await write_in_thread(consume, iterable, batch_size, max_batches, loop, executor)
+
+
+def _chunk_items(chunk, yield_chunks):
+    if yield_chunks == "columns":
+        return [chunk.to_dict("list")]
+    elif yield_chunks:
+        return [chunk]
+    return chunk.to_dict("records")
+
 
-    def sync_parse(sync_q):
-        for chunk in pd.read_csv(filepath_or_buffer, chunksize=chunksize, **kwargs):
-            sync_q.put(chunk)
-        sync_q.put(None)
+async def _read_sharded(path, chunksize, workers, shard_size, ordered, loop, executor, kwargs):
+    if not isinstance(path, str) or is_url(path) or _infer_compression(path, kwargs.get("compression", "infer")):
+        raise ValueError("Sharded parsing needs the path of an uncompressed local file")
+    for option in ("skiprows", "skipfooter", "nrows", "iterator", "chunksize"):
+        if kwargs.get(option):
+            raise ValueError(f"'{option}' is not supported when parsing in shards")
 
-    loop.run_in_executor(executor, sync_parse, queue.sync_q)
+    kwargs = dict(kwargs)
+    kwargs.pop("compression", None)
+    header = kwargs.pop("header", "infer")
+    names = kwargs.pop("names", None)
+    if header == "infer":
+        header = None if names is not None else 0
+    if header not in (0, None):
+        raise ValueError("Only header=0 or header=None are supported when parsing in shards")
+    if header == 0 and names is None:
+        # the names of all columns, usecols and index_col are applied to every shard
+        header_kwargs = {k: v for k, v in kwargs.items() if k not in ("usecols", "index_col", "dtype")}
+        names = list(pd.read_csv(path, nrows=0, **header_kwargs).columns)
 
-    q = queue.async_q
+    quoting = kwargs.get("quoting", 0)
+    quotechar = None if quoting == 3 else kwargs.get("quotechar", '"')
+    ranges = await loop.run_in_executor(None, _shard_ranges, path, shard_size, quotechar, header == 0)
 
+    owned = not isinstance(executor, ProcessPoolExecutor)
+    if owned:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    workers = workers or getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+
+    def parse(shard):
+        start, end = shard
+        return loop.run_in_executor(executor, _parse_shard, path, start, end, names, kwargs)
+
+    rows = 0
+    try:
+        async for frame in map_concurrent(parse, ranges, 2 * workers, ordered):
+            if "index_col" not in kwargs:
+                frame.index = pd.RangeIndex(rows, rows + len(frame))
+            rows += len(frame)
+            for i in range(0, len(frame), chunksize):
+                yield frame.iloc[i:i + chunksize]
+    finally:
+        if owned:
+            executor.shutdown(wait=False)
+
+
+def _parse_shard(path, start, end, names, kwargs):
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(io.BytesIO(data), header=None, names=names, **kwargs)
+
+
+def _count(buffer, char, start, end, window=16*1024*1024):
+    if char is None:
+        return 0
+    return sum(buffer[i:min(i + window, end)].count(char) for i in range(start, end, window))
+
+
+def _record_end(buffer, quote, pos, odd):
+    """
+    Find the end of the record that contains ``pos``. ``odd`` is whether an odd number of quotes precedes
+    ``pos``, a newline only ends a record if it is preceded by an even number of quotes.
+    Returns the position after the newline and the quote parity there.
+    """
     while True:
-        chunk = await q.get()
-        if chunk is None:
-            break
-        for index, row in chunk.iterrows():
-            yield row.to_dict()
-        q.task_done()
+        newline = buffer.find(b"\n", pos)
+        if newline == -1:
+            return len(buffer), odd
+        odd ^= _count(buffer, quote, pos, newline) & 1
+        pos = newline + 1
+        if not odd:
+            return pos, odd
+
+
+def _shard_ranges(path, shard_size, quotechar='"', header=True):
+    """Split a CSV file into byte ranges of about ``shard_size`` bytes that start and end on record boundaries."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        quote = quotechar.encode() if quotechar else None
+        start, odd = _record_end(buffer, quote, 0, 0) if header else (0, 0)
+        counted = start
+        ranges = []
+        while start < size:
+            end = start + shard_size
+            if end >= size:
+                ranges.append((start, size))
+                break
+            odd ^= _count(buffer, quote, counted, end) & 1
+            end, odd = _record_end(buffer, quote, end, odd)
+            ranges.append((start, end))
+            start = counted = end
+        return ranges
@@ -1,18 +1,180 @@
 import asyncio
-from ..utils import open_file
+import codecs
+import re
+from json import JSONDecoder, JSONDecodeError
+from ..utils import open_file, open_output, iterate_in_thread, write_in_thread, CountingReader, RemoteFile
 try:
     import ujson as json
 except ImportError:
     import json
 
 
-async def read_json(filepath_or_buffer, compression="infer", encoding=None, loop=None, executor=None):
+async def read_json(filepath_or_buffer, compression="infer", encoding=None, memory_map=False, decompress_threads=1,
+                    session=None, loop=None, executor=None):
 
     if loop is None:
         loop = asyncio.get_event_loop()
 
-    def sync_parse():
-        with open_file(filepath_or_buffer, compression=compression, encoding=encoding) as f:
-            return json.load(f)
+    async with RemoteFile(filepath_or_buffer, compression, session, loop=loop) as source:
 
-    return await loop.run_in_executor(executor, sync_parse)
+        def sync_parse():
+            with open_file(source.file, compression=source.compression, encoding=encoding, memory_map=memory_map,
+                           decompress_threads=decompress_threads) as f:
+                return json.load(f)
+
+        return await loop.run_in_executor(executor, sync_parse)
+
+
+async def stream_json(filepath_or_buffer, path="item", lines=False, compression="infer", encoding=None,
+                      chunk_size=64*1024, batch_size=1000, batch_bytes=None, max_batches=8, memory_map=False,
+                      decompress_threads=1, session=None, loop=None, executor=None):
+    """
+    Incrementally parse a JSON document and yield the values found at ``path`` one at a time.
+    ``path`` is a dot separated list of object keys, where ``item`` stands for the elements of an array,
+    e.g. ``"item"`` for a top-level array or ``"items.item"`` for the array in the ``items`` key.
+    With ``lines=True`` the file is read as NDJSON/JSON Lines and every line is yielded.
+    Values are handed over from the parser thread in batches, see ``read_xml``, which also describes
+    reading from URLs and responses and the ``memory_map`` and ``decompress_threads`` options.
+    """
+
+    async with RemoteFile(filepath_or_buffer, compression, session, loop=loop) as source:
+
+        def produce(emit):
+            with open_file(source.file, compression=source.compression, encoding=encoding, memory_map=memory_map,
+                           decompress_threads=decompress_threads) as f:
+                if lines:
+                    for line in f:
+                        if line.strip():
+                            emit(json.loads(line), len(line))
+                else:
+                    reader = CountingReader(f)
+                    scanner = _JSONScanner(reader, chunk_size, encoding)
+                    for item in scanner.items(path.split(".") if path else []):
+                        emit(item, reader.consumed())
+
+        async for batch in iterate_in_thread(produce, batch_size, batch_bytes, max_batches, loop, executor):
+            for item in batch:
+                yield item
+
+
+async def write_json(iterable, path, lines=False, compression="infer", encoding="utf-8", batch_size=1000,
+                     max_batches=8, buffer_size=1024*1024, loop=None, executor=None):
+    """
+    Write the items of a sync or async iterable as a JSON array, or as NDJSON/JSON Lines if ``lines`` is True.
+    Items are serialised and written in an executor thread, see ``write_csv``. Returns the number of written items.
+    """
+
+    def consume(batches):
+        n = 0
+        with open_output(path, "w", encoding, compression, buffer_size) as f:
+            if not lines:
+                f.write("[")
+            for batch in batches:
+                encoded = [json.dumps(getattr(item, "data", item)) for item in batch]
+                if lines:
+                    f.write("\n".join(encoded) + "\n")
+                else:
+                    f.write(("," if n else "") + ",".join(encoded))
+                n += len(encoded)
+            if not lines:
+                f.write("]")
+        return n
+
+    return await write_in_thread(consume, iterable, batch_size, max_batches, loop, executor)
+
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+_delimiters = frozenset(" \t\n\r,:]}")
+
+
+class _JSONScanner:
+    """Pull parser that decodes only the values on a path and keeps a small window of the document in memory."""
+
+    def __init__(self, f, chunk_size, encoding=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder(encoding or "utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        chunk = self.f.read(size or self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = self.text_decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        c = self._peek()
+        if c != char:
+            raise ValueError(f"Expected '{char}' but found {c!r}")
+        self.pos += 1
+
+    def _next_separator(self, end):
+        c = self._peek()
+        self.pos += 1
+        if c == end:
+            return False
+        if c != ",":
+            raise ValueError(f"Expected ',' or '{end}' but found {c!r}")
+        return True
+
+    def value(self):
+        self._peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer could continue in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in _delimiters):
+                    self.pos = end
+                    return obj
+            except JSONDecodeError:
+                if self.eof:
+                    raise
+            # grow the read size with the value so large values are decoded in linear time
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def items(self, path):
+        if not path:
+            yield self.value()
+            return
+
+        key, rest = path[0], path[1:]
+
+        if key == "item":
+            self._expect("[")
+            if self._peek() == "]":
+                self.pos += 1
+                return
+            while True:
+                yield from self.items(rest)
+                if not self._next_separator("]"):
+                    return
+
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            name = self.value()
+            self._expect(":")
+            if name == key:
+                yield from self.items(rest)
+            else:
+                self.value()
+            if not self._next_separator("}"):
+                return
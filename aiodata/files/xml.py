@@ -1,31 +1,56 @@
 import xmltodict
-import asyncio
-import janus
-from ..utils import open_file
-
-
-async def read_xml(filepath_or_buffer, compression="infer", encoding=None, loop=None, executor=None, **kwargs):
-
-    if loop is None:
-        loop = asyncio.get_event_loop()
-
-    queue = janus.Queue(loop=loop)
-
-    def sync_parse(sync_q):
-        def item_callback(path, item):
-            sync_q.put((path, item))
-            return True
-        with open_file(filepath_or_buffer, compression=compression, encoding=encoding) as f:
-            xmltodict.parse(f, item_callback=item_callback, **kwargs)
-            sync_q.put((None, None))
-
-    loop.run_in_executor(executor, sync_parse, queue.sync_q)
-
-    q = queue.async_q
-
-    while True:
-        p, it = await q.get()
-        if it is None:
-            break
-        yield p, it
-        q.task_done()
+from ..utils import open_file, open_output, iterate_in_thread, write_in_thread, CountingReader, RemoteFile
+
+
+async def read_xml(filepath_or_buffer, compression="infer", encoding=None, batch_size=1000, batch_bytes=None,
+                   max_batches=8, memory_map=False, decompress_threads=1, session=None, loop=None, executor=None,
+                   **kwargs):
+    """
+    Parse an XML file in an executor thread and yield ``(path, item)`` for every item found by xmltodict.
+    The parser thread hands items over in batches of ``batch_size`` items or ``batch_bytes`` bytes of input,
+    and blocks while ``max_batches`` batches are waiting to be consumed.
+    ``filepath_or_buffer`` can also be a URL or an aiohttp response, which is decompressed and parsed
+    while it is downloaded, see ``RemoteFile``. ``memory_map`` and ``decompress_threads`` are passed to
+    ``open_file``.
+    """
+
+    async with RemoteFile(filepath_or_buffer, compression, session, loop=loop) as source:
+
+        def produce(emit):
+            # expat needs bytes, the encoding is handled by the parser
+            with open_file(source.file, mode="rb", compression=source.compression, memory_map=memory_map,
+                           decompress_threads=decompress_threads) as f:
+                reader = CountingReader(f)
+
+                def item_callback(path, item):
+                    # xmltodict reuses the path list while parsing, every item gets its own copy
+                    emit((list(path), item), reader.consumed())
+                    return True
+
+                xmltodict.parse(reader, encoding=encoding, item_callback=item_callback, **kwargs)
+
+        async for batch in iterate_in_thread(produce, batch_size, batch_bytes, max_batches, loop, executor):
+            for p, it in batch:
+                yield p, it
+
+
+async def write_xml(iterable, path, root="root", item="item", compression="infer", encoding="utf-8", batch_size=1000,
+                    max_batches=8, buffer_size=1024*1024, loop=None, executor=None, **kwargs):
+    """
+    Write the items of a sync or async iterable as ``item`` elements inside a ``root`` element. Items are
+    converted by ``xmltodict.unparse``, which gets the other keyword arguments, and written in an executor
+    thread, see ``write_csv``. Returns the number of written items.
+    """
+
+    def consume(batches):
+        n = 0
+        with open_output(path, "w", encoding, compression, buffer_size) as f:
+            f.write(f'<?xml version="1.0" encoding="{encoding}"?>\n<{root}>')
+            for batch in batches:
+                f.write("".join(xmltodict.unparse({item: getattr(it, "data", it)}, full_document=False, **kwargs)
+                                for it in batch))
+                n += len(batch)
+            f.write(f"</{root}>\n")
+        return n
+
+    return await write_in_thread(consume, iterable, batch_size, max_batches, loop, executor)
@@ -4,11 +4,25 @@ import asyncio
 import aiohttp
 import aiofiles
 import gzip
+import io
+import queue
 import zipfile
 import bz2
 import lzma
+import zlib
+import collections
+import hashlib
+import json
+import mmap
+import math
+import struct
+import tempfile
+import time
+import janus
 from pandas.io.common import get_filepath_or_buffer, _infer_compression
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from yarl import URL
 from itertools import zip_longest
 from collections import AsyncIterable
 
@@ -38,7 +52,9 @@ def returns(*classes):
         return wrapped
 
     if len(classes) == 1 and not isinstance(classes[0], type) and callable(classes[0]):
-        return wrapper(classes[0])
+        # used as @returns without arguments, results are cast to the class of the first argument
+        func, classes = classes[0], ()
+        return wrapper(func)
 
     return wrapper
 
@@ -53,7 +69,403 @@ async def chain(*iterables):
                 yield element
 
 
-def open_file(filepath_or_buffer, mode="r", encoding=None, compression="infer"):
+async def batched(iterable, size):
+    """Group the elements of a sync or async iterable into lists of at most ``size`` elements."""
+    if size < 1:
+        raise ValueError(f"size must be at least 1, got {size}")
+
+    batch = []
+    async for element in chain(iterable):
+        batch.append(element)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def map_concurrent(func, iterable, max_concurrency=100, ordered=False):
+    """Apply the coroutine function ``func`` to every element of ``iterable`` with
+    at most ``max_concurrency`` calls in flight. New calls are started while the
+    source is still being consumed. Results are yielded as they complete, or in
+    input order if ``ordered`` is True."""
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+
+    source = chain(iterable).__aiter__()
+    pending = collections.deque() if ordered else set()
+    done = []
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < max_concurrency:
+                try:
+                    element = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                future = asyncio.ensure_future(func(element))
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+
+            if not pending:
+                break
+
+            if ordered:
+                yield await pending.popleft()
+            else:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                done = list(done)
+                while done:
+                    yield done.pop().result()
+    finally:
+        # retrieve the results that won't be yielded anymore, so failures aren't reported as never retrieved
+        for future in [*done, *pending]:
+            if future.done():
+                if not future.cancelled():
+                    future.exception()
+            else:
+                future.cancel()
+        await source.aclose()
+
+
+async def iterate_in_thread(produce, batch_size=1000, batch_bytes=None, max_batches=8, loop=None, executor=None):
+    """
+    Run ``produce(emit)`` in an executor thread and yield the items passed to ``emit`` in lists.
+    Items are handed over once ``batch_size`` items or, if ``emit`` is given the size of each item,
+    ``batch_bytes`` bytes have been collected. At most ``max_batches`` batches are queued, so the
+    producer blocks when the consumer is slow. Exceptions raised by ``produce`` are re-raised here.
+    """
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    queue = janus.Queue(maxsize=max_batches, loop=loop)
+    cancelled = False
+
+    class Cancelled(Exception):
+        pass
+
+    def run(sync_q):
+        batch = []
+        size = 0
+
+        def emit(item, nbytes=0):
+            nonlocal batch, size
+            if cancelled:
+                raise Cancelled()
+            batch.append(item)
+            size += nbytes
+            if len(batch) >= batch_size or (batch_bytes is not None and size >= batch_bytes):
+                sync_q.put((batch, None))
+                batch = []
+                size = 0
+
+        try:
+            produce(emit)
+            if batch:
+                sync_q.put((batch, None))
+            sync_q.put((None, None))
+        except Cancelled:
+            pass
+        except Exception as e:
+            sync_q.put((None, e))
+
+    loop.run_in_executor(executor, run, queue.sync_q)
+
+    q = queue.async_q
+
+    try:
+        while True:
+            batch, error = await q.get()
+            q.task_done()
+            if batch is None:
+                if error is not None:
+                    raise error
+                break
+            yield batch
+    finally:
+        # unblock and stop the producer if the consumer stopped early
+        cancelled = True
+        while not q.empty():
+            q.get_nowait()
+            q.task_done()
+
+
+async def write_in_thread(consume, iterable, batch_size=1000, max_batches=8, loop=None, executor=None):
+    """
+    Collect the items of a sync or async ``iterable`` in lists of ``batch_size`` items and run
+    ``consume(batches)`` in an executor thread, where ``batches`` is a blocking iterator over these lists.
+    At most ``max_batches`` batches are queued, so the source is only consumed as fast as the thread keeps up.
+    Returns the result of ``consume`` and re-raises its exceptions.
+    """
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    batch_queue = janus.Queue(maxsize=max_batches, loop=loop)
+
+    def batches():
+        while True:
+            batch = batch_queue.sync_q.get()
+            if batch is None:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+
+    future = loop.run_in_executor(executor, consume, batches())
+
+    async def put(batch):
+        put_future = asyncio.ensure_future(batch_queue.async_q.put(batch))
+        try:
+            await asyncio.wait([put_future, future], return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            put_future.cancel()
+            raise
+        if not put_future.done():
+            # the consumer stopped, raise its error
+            put_future.cancel()
+            future.result()
+            raise RuntimeError("consume returned before all batches were passed to it")
+
+    try:
+        async for batch in batched(iterable, batch_size):
+            await put(batch)
+        await put(None)
+    except BaseException:
+        # also on cancellation: drop the queued batches and stop the consumer without waiting for it
+        while True:
+            try:
+                batch_queue.sync_q.get_nowait()
+            except queue.Empty:
+                break
+        batch_queue.sync_q.put_nowait(ValueError("Writing was stopped before all items were written"))
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise
+
+    return await future
+
+
+class CountingReader:
+    """File wrapper that counts the bytes (or characters) read through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def consumed(self):
+        """Return the number of bytes read since the last call."""
+        n, self.bytes_read = self.bytes_read, 0
+        return n
+
+
+def _canonical(value):
+    # resources are compared by their data, numbers by their value, so 1 and 1.0 are the same
+    if isinstance(value, collections.UserDict):
+        value = value.data
+    elif callable(getattr(value, "to_dict", None)):
+        value = value.to_dict()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise TypeError(f"Can't fingerprint a value of type {type(value).__name__}")
+
+
+def fingerprint(value):
+    """
+    Return a stable 16 byte digest of a JSON-like value, independent of the order of dict keys.
+    Raises TypeError for values that can't be represented as JSON.
+    """
+    encoded = json.dumps(_canonical(value), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    Set of fingerprints with constant memory, sized for ``capacity`` elements with a false positive
+    probability of ``error_rate``. Elements must be byte strings of at least 16 bytes, e.g. fingerprints.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, element):
+        # double hashing, the element is already a uniformly distributed hash
+        h1 = int.from_bytes(element[:8], "little")
+        h2 = int.from_bytes(element[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, element):
+        for p in self._positions(element):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, element):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(element))
+
+
+class MemoryMappedFile(io.RawIOBase):
+    """
+    Read-only binary file object over a memory mapped file. Reads are served from the page cache without
+    an intermediate file buffer.
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.name = filename
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mmap.seek(offset, whence)
+        return self._mmap.tell()
+
+    def tell(self):
+        return self._mmap.tell()
+
+    def read(self, size=-1):
+        return self._mmap.read(-1 if size is None else size)
+
+    def readinto(self, b):
+        pos = self._mmap.tell()
+        n = min(len(b), len(self._mmap) - pos)
+        with memoryview(self._mmap) as view:
+            b[:n] = view[pos:pos + n]
+        self._mmap.seek(pos + n)
+        return n
+
+    def readline(self, size=-1):
+        line = self._mmap.readline()
+        if 0 <= size < len(line):
+            self._mmap.seek(size - len(line), io.SEEK_CUR)
+            line = line[:size]
+        return line
+
+    def close(self):
+        if not self.closed:
+            self._mmap.close()
+        super().close()
+
+
+def _inflate_block(block):
+    data = zlib.decompress(block[:-8], -zlib.MAX_WBITS)
+    crc, size = struct.unpack("<II", block[-8:])
+    if zlib.crc32(data) != crc or len(data) != size:
+        raise ValueError("Corrupt BGZF block")
+    return data
+
+
+def _is_bgzf_header(header):
+    # gzip member with FEXTRA, XLEN 6 and the "BC" subfield holding the block size
+    return len(header) == 18 and header[:4] == b"\x1f\x8b\x08\x04" and header[10:16] == b"\x06\x00BC\x02\x00"
+
+
+def is_bgzf(filename):
+    with open(filename, "rb") as f:
+        return _is_bgzf_header(f.read(18))
+
+
+class BGZFReader(io.RawIOBase):
+    """
+    Read a BGZF file, the blocked gzip format written by bgzip, inflating up to ``threads`` blocks in parallel.
+    The block sizes are stored in the gzip headers, so the blocks can be split off without decompressing
+    them, and zlib releases the GIL while it inflates.
+    """
+
+    def __init__(self, filename, threads=None, executor=None):
+        super().__init__()
+        self.name = filename
+        self.threads = threads or os.cpu_count() or 1
+        self._f = open(filename, "rb")
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(self.threads)
+        self._pending = collections.deque()
+        self._chunk = b""
+        self._pos = 0
+        self._eof = False
+
+    def _submit_blocks(self):
+        while not self._eof and len(self._pending) < 2 * self.threads:
+            header = self._f.read(18)
+            if not header:
+                self._eof = True
+                break
+            if not _is_bgzf_header(header):
+                raise ValueError(f"{self.name} is not a BGZF file")
+            size = int.from_bytes(header[16:18], "little") + 1 - len(header)
+            block = self._f.read(size)
+            if len(block) != size:
+                raise EOFError(f"{self.name} ended in the middle of a block")
+            self._pending.append(self._executor.submit(_inflate_block, block))
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._chunk):
+            self._submit_blocks()
+            if not self._pending:
+                return 0
+            self._chunk, self._pos = self._pending.popleft().result(), 0
+        n = min(len(b), len(self._chunk) - self._pos)
+        b[:n] = self._chunk[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._f.close()
+            if self._owns_executor:
+                self._executor.shutdown(wait=False)
+        super().close()
+
+
+def _closing(f, resource):
+    """Close ``resource`` when the file object ``f`` is closed."""
+    close = f.close
+
+    def close_both():
+        try:
+            close()
+        finally:
+            resource.close()
+
+    f.close = close_both
+    return f
+
+
+def open_file(filepath_or_buffer, mode="r", encoding=None, compression="infer", memory_map=False,
+              decompress_threads=1):
+    """
+    Open a path or buffer for reading, decompressing it if needed. With ``memory_map`` local files are
+    read through a ``MemoryMappedFile``. Local BGZF files are inflated with ``decompress_threads`` threads,
+    other gzip files are decompressed sequentially.
+    """
     if encoding is not None:
         encoding = re.sub("_", "-", encoding).lower()
 
@@ -62,10 +474,26 @@ def open_file(filepath_or_buffer, mode="r", encoding=None, compression="infer"):
 
     is_path = isinstance(filepath_or_buffer, str)
 
+    if is_path and memory_map and os.path.getsize(filepath_or_buffer) > 0:
+        if not compression:
+            f = MemoryMappedFile(filepath_or_buffer)
+            return f if "b" in mode else io.TextIOWrapper(f, encoding=encoding)
+        if not (compression == "gzip" and decompress_threads > 1):
+            mapped = MemoryMappedFile(filepath_or_buffer)
+            try:
+                f = open_file(mapped, mode, encoding, compression, decompress_threads=decompress_threads)
+            except BaseException:
+                mapped.close()
+                raise
+            # decompressors don't close a fileobj they didn't open
+            return _closing(f, mapped)
+
     if compression:
 
         # GZ Compression
         if compression == "gzip":
+            if is_path and decompress_threads > 1 and is_bgzf(filepath_or_buffer):
+                return io.BufferedReader(BGZFReader(filepath_or_buffer, decompress_threads), 1024*1024)
             if is_path:
                 return gzip.open(filepath_or_buffer, mode)
             return gzip.GzipFile(fileobj=filepath_or_buffer)
@@ -78,6 +506,9 @@ def open_file(filepath_or_buffer, mode="r", encoding=None, compression="infer"):
 
         # ZIP Compression
         elif compression == "zip":
+            if not is_path and not filepath_or_buffer.seekable():
+                # the central directory is at the end, streams have to be buffered in memory
+                filepath_or_buffer = io.BytesIO(filepath_or_buffer.read())
             zip_file = zipfile.ZipFile(filepath_or_buffer)
             zip_names = zip_file.namelist()
             if len(zip_names) == 1:
@@ -98,41 +529,504 @@ def open_file(filepath_or_buffer, mode="r", encoding=None, compression="infer"):
     elif is_path:
         return open(filepath_or_buffer, mode, encoding=encoding)
 
+    return filepath_or_buffer
+
+
+def open_output(filepath_or_buffer, mode="wb", encoding=None, compression="infer", buffer_size=1024*1024):
+    """
+    Open a path or buffer for writing in blocks of ``buffer_size`` bytes, compressing with gzip, bz2, xz or,
+    if the zstandard package is installed, zstd. ``compression`` is inferred from the file extension.
+    Text modes return a text wrapper around the binary stream.
+    """
+    is_path = isinstance(filepath_or_buffer, str)
+    if compression == "infer":
+        compression = None
+        if is_path:
+            _, ext = os.path.splitext(filepath_or_buffer)
+            compression = "zstd" if ext in (".zst", ".zstd") else _infer_compression(filepath_or_buffer, "infer")
+
+    if compression is None:
+        f = open(filepath_or_buffer, "wb", buffering=buffer_size) if is_path else filepath_or_buffer
+    elif compression == "gzip":
+        f = gzip.open(filepath_or_buffer, "wb") if is_path else gzip.GzipFile(fileobj=filepath_or_buffer, mode="wb")
+    elif compression == "bz2":
+        f = bz2.BZ2File(filepath_or_buffer, "wb")
+    elif compression == "xz":
+        f = lzma.LZMAFile(filepath_or_buffer, "wb")
+    elif compression == "zstd":
+        import zstandard
+        raw = open(filepath_or_buffer, "wb") if is_path else filepath_or_buffer
+        f = zstandard.ZstdCompressor().stream_writer(raw)
+    else:
+        raise ValueError(f"Unsupported compression type for writing: {compression}")
+
+    if compression is not None:
+        # hand the compressor large blocks instead of every small write
+        f = io.BufferedWriter(f, buffer_size)
+
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f, encoding=encoding or "utf-8", newline="")
+
+
+_compression_types = {
+    "application/gzip": "gzip",
+    "application/x-gzip": "gzip",
+    "application/x-bzip2": "bz2",
+    "application/x-xz": "xz",
+    "application/zip": "zip",
+}
+
+
+def is_url(filepath_or_buffer):
+    return isinstance(filepath_or_buffer, URL) or \
+        isinstance(filepath_or_buffer, str) and filepath_or_buffer.startswith(("http://", "https://"))
+
+
+class ResponseReader(io.RawIOBase):
+    """
+    Blocking binary file object over the body of an aiohttp response, for use in a parser thread.
+    The body is read on the event loop and handed over in chunks through a queue of at most ``max_chunks``.
+    """
+
+    def __init__(self, response, max_chunks=16, loop=None):
+        super().__init__()
+        self.response = response
+        self.name = response.url.path
+        self._queue = janus.Queue(maxsize=max_chunks, loop=loop)
+        self._chunk = b""
+        self._pos = 0
+        self._eof = False
+        self._task = asyncio.ensure_future(self._receive(), loop=loop)
+
+    async def _receive(self):
+        q = self._queue.async_q
+        try:
+            async for chunk in self.response.content.iter_any():
+                await q.put(chunk)
+            await q.put(b"")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await q.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._chunk):
+            if self._eof:
+                return 0
+            chunk = self._queue.sync_q.get()
+            if isinstance(chunk, Exception):
+                self._eof = True
+                raise chunk
+            if not chunk:
+                self._eof = True
+                return 0
+            self._chunk, self._pos = chunk, 0
+        n = min(len(b), len(self._chunk) - self._pos)
+        b[:n] = self._chunk[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def abort(self):
+        """Stop receiving, a thread still reading gets an error instead of blocking forever."""
+        self._task.cancel()
+        # drop the chunks nobody will parse, so there is always room for the error
+        while True:
+            try:
+                self._queue.sync_q.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.sync_q.put_nowait(ValueError(f"Reading {self.response.url} was aborted"))
+
+
+class RemoteFile:
+    """
+    Async context manager that streams a URL or an aiohttp response to a file object for the file readers.
+    ``file`` is a buffered ``ResponseReader`` and ``compression`` is inferred from the URL and Content-Type.
+    Local paths and buffers are passed through unchanged, so readers can use it for every source.
+    """
+
+    def __init__(self, filepath_or_buffer, compression="infer", session=None, max_chunks=16, loop=None):
+        self.source = filepath_or_buffer
+        self.file = filepath_or_buffer
+        self.compression = compression
+        self.session = session
+        self.max_chunks = max_chunks
+        self.loop = loop
+        self.response = None
+        self._reader = None
+        self._owns_session = False
+
+    @property
+    def is_remote(self):
+        return self._reader is not None
+
+    async def __aenter__(self):
+        if is_url(self.source):
+            if self.session is None:
+                self.session = aiohttp.ClientSession()
+                self._owns_session = True
+            try:
+                self.response = await self.session.get(self.source)
+                self.response.raise_for_status()
+            except Exception:
+                await self.__aexit__(None, None, None)
+                raise
+        elif isinstance(self.source, aiohttp.ClientResponse):
+            self.response = self.source
+        else:
+            return self
+
+        if self.compression == "infer":
+            content_type = self.response.headers.get(aiohttp.hdrs.CONTENT_TYPE, "").split(";")[0].strip()
+            self.compression = _infer_compression(self.response.url.path, "infer") or \
+                _compression_types.get(content_type.lower())
+
+        self._reader = ResponseReader(self.response, self.max_chunks, self.loop)
+        self.file = io.BufferedReader(self._reader)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._reader is not None:
+            self._reader.abort()
+        if self.response is not None and self.response is not self.source:
+            self.response.close()
+        if self._owns_session:
+            await self.session.close()
+
+
+def _response_filename(response, download_dir=None, overwrite=False, claimed=None, owner=None):
+    """
+    Choose the file name for a response. Names in ``claimed`` that belong to another ``owner`` are
+    taken, like existing files if not ``overwrite``, and the chosen name is claimed for ``owner``.
+    """
+    content_disposition = response.headers.get(aiohttp.hdrs.CONTENT_DISPOSITION)
+    filename = None
+    if content_disposition is not None:
+        disptype, params = aiohttp.parse_content_disposition(content_disposition)
+        filename = params.get("filename")
+    if not filename:
+        filename = os.path.basename(response.url.path)
+    if download_dir is not None:
+        filename = os.path.join(download_dir, filename)
+
+    def taken(name):
+        if claimed is not None and claimed.get(name, owner) != owner:
+            return True
+        return not overwrite and os.path.isfile(name)
+
+    new_filename = filename
+    i = 1
+    while taken(new_filename):
+        path, ext = os.path.splitext(filename)
+        new_filename = f"{path}({i}){ext}"
+        i += 1
+    if claimed is not None:
+        claimed[new_filename] = owner
+    return new_filename
+
+
+class _Progress:
+    """Counts written bytes and reports them with the throughput since the start to ``callback``."""
+
+    def __init__(self, callback=None, total=None, done=0):
+        self.callback = callback
+        self.total = total
+        self.done = done
+        self.initial = done
+        self.start = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.start
+        return (self.done - self.initial) / elapsed if elapsed > 0 else 0.0
+
+    def update(self, n):
+        self.done += n
+        if self.callback is not None:
+            self.callback(self.done, self.total, self.rate)
+
+
+def _write_at(f, offset, data):
+    f.seek(offset)
+    f.write(data)
+
+
+def _file_digest(filename, hash_name, chunk_size=1024*1024):
+    h = hashlib.new(hash_name)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _save_json(filename, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename) or os.curdir, suffix=".tmp")
+    try:
+        with open(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+async def _verify_download(filename, size, checksum, hash_name, loop, executor):
+    actual = os.path.getsize(filename)
+    if size is not None and actual != size:
+        raise ValueError(f"Downloaded {actual} bytes to {filename}, expected {size}")
+    if checksum is not None:
+        digest = await loop.run_in_executor(executor, _file_digest, filename, hash_name)
+        if digest != checksum.lower():
+            raise ValueError(f"{hash_name} of {filename} is {digest}, expected {checksum}")
+
+
+async def _download_ranges(session, url, filename, total, validator, *, connections, segment_size, chunk_size,
+                           buffer_size, resume, progress, loop, executor):
+    part_name = filename + ".part"
+    state_name = part_name + ".json"
+    segments = [(start, min(start + segment_size, total)) for start in range(0, total, segment_size)]
+    state = {"size": total, "validator": validator, "segment_size": segment_size, "done": []}
+
+    if resume and validator is not None and os.path.isfile(part_name) and os.path.isfile(state_name):
+        with open(state_name) as f:
+            saved = json.load(f)
+        if all(saved.get(k) == state[k] for k in ("size", "validator", "segment_size")):
+            state["done"] = saved["done"]
+
+    if not state["done"]:
+        with open(part_name, "wb") as f:
+            f.truncate(total)
+
+    done = set(state["done"])
+    meter = _Progress(progress, total, sum(end - start for i, (start, end) in enumerate(segments) if i in done))
+    state_lock = asyncio.Lock()
+
+    async def fetch_segment(index):
+        start, end = segments[index]
+        headers = {aiohttp.hdrs.RANGE: f"bytes={start}-{end - 1}", aiohttp.hdrs.ACCEPT_ENCODING: "identity"}
+        if validator is not None:
+            headers[aiohttp.hdrs.IF_RANGE] = validator
+
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            if response.status != 206:
+                raise ValueError(f"{url} changed during the download or ignored the range request")
+
+            f = await loop.run_in_executor(executor, open, part_name, "r+b")
+            try:
+                offset = start
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    buffer += chunk
+                    if len(buffer) >= buffer_size:
+                        await loop.run_in_executor(executor, _write_at, f, offset, bytes(buffer))
+                        offset += len(buffer)
+                        meter.update(len(buffer))
+                        buffer.clear()
+                if buffer:
+                    await loop.run_in_executor(executor, _write_at, f, offset, bytes(buffer))
+                    offset += len(buffer)
+                    meter.update(len(buffer))
+            finally:
+                await loop.run_in_executor(executor, f.close)
+
+        if offset != end:
+            raise ValueError(f"Received {offset - start} bytes for range {start}-{end - 1} of {url}")
+
+        # segments finish concurrently, the state file is replaced by one of them at a time
+        async with state_lock:
+            done.add(index)
+            state["done"] = sorted(done)
+            await loop.run_in_executor(executor, _save_json, state_name, dict(state))
+
+    pending = [i for i in range(len(segments)) if i not in done]
+    async for _ in map_concurrent(fetch_segment, pending, max_concurrency=connections):
+        pass
+
+    return part_name, state_name
+
+
+async def download(session, url, *, download_dir=None, params=None, chunk_size=100*1024, overwrite=False,
+                   connections=1, segment_size=8*1024*1024, buffer_size=1024*1024, resume=False, size=None,
+                   checksum=None, hash_name="sha256", progress=None, claimed=None, loop=None, executor=None):
+    """
+    Download ``url`` and return the name of the written file. ``claimed`` maps file names that concurrent
+    downloads write to their URL, names claimed for other URLs aren't used, see ``download_many``.
+
+    With ``connections`` > 1 or ``resume``, and if the server accepts range requests, the file is
+    fetched in segments of ``segment_size`` bytes over up to ``connections`` parallel requests into a
+    preallocated ``.part`` file. Finished segments are recorded in a ``.part.json`` file next to it,
+    so calling ``download`` again with ``resume=True`` after a failure only fetches what is missing.
+    Data is written in blocks of ``buffer_size`` bytes. The result is checked against ``size`` and
+    the hex digest ``checksum`` (computed with ``hash_name``) if given. ``progress(done, total,
+    bytes_per_second)`` is called as data is written, total is None if the server did not send it.
+    """
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    if connections > 1 or resume:
+        async with session.head(url, params=params, allow_redirects=True) as response:
+            headers = response.headers if response.status < 400 else {}
+            filename = _response_filename(response, download_dir, overwrite, claimed, str(url))
+            final_url = response.url
+
+        total = headers.get(aiohttp.hdrs.CONTENT_LENGTH)
+        accepts_ranges = headers.get(aiohttp.hdrs.ACCEPT_RANGES, "").lower() == "bytes"
+        if accepts_ranges and total and not headers.get(aiohttp.hdrs.CONTENT_ENCODING):
+            total = int(total)
+            if size is not None and size != total:
+                raise ValueError(f"{url} has {total} bytes, expected {size}")
+            validator = headers.get(aiohttp.hdrs.ETAG) or headers.get(aiohttp.hdrs.LAST_MODIFIED)
+            part_name, state_name = await _download_ranges(
+                session, final_url, filename, total, validator, connections=connections, segment_size=segment_size,
+                chunk_size=chunk_size, buffer_size=buffer_size, resume=resume, progress=progress, loop=loop,
+                executor=executor)
+            try:
+                await _verify_download(part_name, total, checksum, hash_name, loop, executor)
+            except ValueError:
+                # the partial data is useless, start from scratch next time
+                os.remove(part_name)
+                os.remove(state_name)
+                raise
+            os.replace(part_name, filename)
+            os.remove(state_name)
+            return filename
 
-async def download(session, url, *, download_dir=None, params=None, chunk_size=100*1024, overwrite=False):
     async with session.get(url, params=params) as response:
         response.raise_for_status()
-        content_disposition = response.headers.get(aiohttp.hdrs.CONTENT_DISPOSITION)
-        if content_disposition is None:
-            u = response.url
-            filename = os.path.basename(u.path)
-        else:
-            disptype, params = aiohttp.parse_content_disposition(content_disposition)
-            filename = params["filename"]
-        if download_dir is not None:
-            filename = os.path.join(download_dir, filename)
-
-        new_filename = filename
-        i = 1
-        while not overwrite and os.path.isfile(new_filename):
-            path, ext = os.path.splitext(filename)
-            new_filename = f"{path}({i}){ext}"
-            i += 1
-        filename = new_filename
-
-        size = response.headers.get(aiohttp.hdrs.CONTENT_LENGTH)
-        size = int(size or chunk_size)
-        if size < chunk_size:
-            chunk_size = size
-
-        async with aiofiles.open(filename, "wb") as f:
-            while True:
-                chunk = await response.content.read(chunk_size)
-                if not chunk:
-                    break
-                await f.write(chunk)
+        filename = _response_filename(response, download_dir, overwrite, claimed, str(url))
+
+        total = response.headers.get(aiohttp.hdrs.CONTENT_LENGTH)
+        total = int(total) if total else None
+        if total is not None and total < chunk_size:
+            chunk_size = max(total, 1)
+        meter = _Progress(progress, total)
+        part_name = filename + ".part"
+
+        async with aiofiles.open(part_name, "wb") as f:
+            buffer = bytearray()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                buffer += chunk
+                if len(buffer) >= buffer_size:
+                    await f.write(bytes(buffer))
+                    meter.update(len(buffer))
+                    buffer.clear()
+            if buffer:
+                await f.write(bytes(buffer))
+                meter.update(len(buffer))
+
+    try:
+        await _verify_download(part_name, size, checksum, hash_name, loop, executor)
+    except ValueError:
+        os.remove(part_name)
+        raise
+    os.replace(part_name, filename)
+    return filename
+
+
+async def download_many(urls, session=None, *, download_dir=None, max_concurrency=10, per_host=4,
+                        skip_unchanged=True, overwrite=True, progress=None, stats=None, return_exceptions=False,
+                        **kwargs):
+    """
+    Download all ``urls`` with at most ``max_concurrency`` files in flight, ``per_host`` of them from
+    the same host, and return a dict mapping every URL to its file name. Duplicate URLs are fetched once.
+    All downloads share ``session``, so connections are reused between files; a session is created if
+    none is given. Files are written to a temporary name and renamed when complete. Different URLs
+    never share a file name, a name that is already used for another URL gets a ``(1)`` suffix.
+
+    With ``skip_unchanged``, the ETag or Last-Modified header of each downloaded file is stored in
+    ``.downloads.json`` in ``download_dir``, and files whose header is unchanged according to a HEAD
+    request are not downloaded again.
+
+    ``progress(done, None, bytes_per_second)`` receives the bytes written over all files. ``stats`` is
+    updated with the number of downloaded, skipped and failed files and the bytes written. With
+    ``return_exceptions``, a failed download maps its URL to the exception instead of raising it.
+    Other keyword arguments are passed to ``download``.
+    """
+
+    loop = kwargs.get("loop") or asyncio.get_event_loop()
+    urls = list(dict.fromkeys(str(url) for url in urls))
+    results = dict.fromkeys(urls)
+    if stats is None:
+        stats = collections.Counter()
+
+    manifest_name = os.path.join(download_dir or os.curdir, ".downloads.json")
+    manifest = {}
+    if skip_unchanged and os.path.isfile(manifest_name):
+        with open(manifest_name) as f:
+            manifest = json.load(f)
+    manifest_lock = asyncio.Lock()
+
+    # file names of the URLs, the files of skipped URLs keep their names
+    claimed = {manifest[url]["filename"]: url for url in urls if url in manifest}
+
+    # a download waits for its host before it takes one of the global slots,
+    # so URLs of a busy host don't block the slots for other hosts
+    hosts = collections.defaultdict(lambda: asyncio.Semaphore(per_host))
+    slots = asyncio.Semaphore(max_concurrency)
+    meter = _Progress(progress)
+
+    def file_progress():
+        last = 0
+
+        def update(done, total, rate):
+            nonlocal last
+            stats["bytes"] += done - last
+            meter.update(done - last)
+            last = done
+
+        return update
+
+    def unchanged(url, validator):
+        entry = manifest.get(url)
+        return (validator is not None and entry is not None and entry["validator"] == validator
+                and os.path.isfile(entry["filename"]) and os.path.getsize(entry["filename"]) == entry["size"])
+
+    async def fetch(url):
+        async with hosts[URL(url).host], slots:
+            try:
+                validator = None
+                if skip_unchanged:
+                    async with session.head(url, allow_redirects=True) as response:
+                        if response.status < 400:
+                            validator = response.headers.get(aiohttp.hdrs.ETAG) \
+                                        or response.headers.get(aiohttp.hdrs.LAST_MODIFIED)
+                    if unchanged(url, validator):
+                        stats["skipped"] += 1
+                        return url, manifest[url]["filename"]
+
+                filename = await download(session, url, download_dir=download_dir, overwrite=overwrite,
+                                          progress=file_progress(), claimed=claimed, **kwargs)
+                stats["downloaded"] += 1
+
+                if validator is not None:
+                    async with manifest_lock:
+                        manifest[url] = {"filename": filename, "validator": validator,
+                                         "size": os.path.getsize(filename)}
+                        await loop.run_in_executor(None, _save_json, manifest_name, dict(manifest))
+                return url, filename
+            except Exception as e:
+                stats["failed"] += 1
+                if not return_exceptions:
+                    raise
+                return url, e
+
+    owns_session = session is None
+    if owns_session:
+        session = aiohttp.ClientSession()
+    try:
+        async for url, result in map_concurrent(fetch, urls, max_concurrency=max(len(urls), 1)):
+            results[url] = result
+    finally:
+        if owns_session:
+            await session.close()
 
-        return filename
+    return results
 
 
 def get_content_type(content_type: str = "", url: str = ""):
@@ -148,8 +1042,10 @@ def get_content_type(content_type: str = "", url: str = ""):
         "json": {".json"}
     }
 
+    # strip parameters such as "; charset=utf-8"
+    content_type = content_type.split(";")[0].strip().lower()
     for t, cts in content_types.items():
-        if content_type.lower() in cts:
+        if content_type in cts:
             return t
 
     _, ext = os.path.splitext(url)
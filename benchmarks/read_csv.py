@@ -0,0 +1,65 @@
+"""
+Compare the throughput (rows/sec) of the different read_csv modes.
+
+Usage: python benchmarks/read_csv.py [rows]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+from aiodata.files import read_csv
+
+
+def make_file(rows):
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    pd.DataFrame({
+        "id": range(rows),
+        "name": [f"name {i}" for i in range(rows)],
+        "value": [i * 0.5 for i in range(rows)],
+        "flag": [i % 2 == 0 for i in range(rows)],
+    }).to_csv(path, index=False)
+    return path
+
+
+async def iterrows(path):
+    # the previous per-row implementation, for reference
+    async for chunk in read_csv(path, yield_chunks=True):
+        for _, row in chunk.iterrows():
+            yield row.to_dict()
+
+
+async def count_rows(path, mode):
+    count = 0
+    if mode == "iterrows":
+        async for _ in iterrows(path):
+            count += 1
+    elif mode == "rows":
+        async for _ in read_csv(path):
+            count += 1
+    elif mode == "chunks":
+        async for chunk in read_csv(path, yield_chunks=True):
+            count += len(chunk)
+    elif mode == "columns":
+        async for columns in read_csv(path, yield_chunks="columns"):
+            count += len(columns["id"])
+    return count
+
+
+def main(rows):
+    path = make_file(rows)
+    loop = asyncio.get_event_loop()
+    try:
+        for mode in ("iterrows", "rows", "chunks", "columns"):
+            start = time.perf_counter()
+            count = loop.run_until_complete(count_rows(path, mode))
+            elapsed = time.perf_counter() - start
+            print(f"{mode:>10}: {count / elapsed:>12,.0f} rows/sec ({elapsed:.2f}s)")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
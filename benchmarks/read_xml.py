@@ -0,0 +1,57 @@
+"""
+Measure the throughput (items/sec) and peak RSS of read_xml for different batch sizes.
+Every configuration runs in a fresh process so the peak RSS figures are independent.
+
+Usage: python benchmarks/read_xml.py [items]
+"""
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from aiodata.files import read_xml
+
+BATCH_SIZES = (1, 100, 1000, 10000)
+
+
+def make_file(items):
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    with os.fdopen(fd, "w") as f:
+        f.write("<feed>")
+        for i in range(items):
+            f.write(f"<item id=\"{i}\"><name>item {i}</name><value>{i * 0.5}</value></item>")
+        f.write("</feed>")
+    return path
+
+
+async def consume(path, batch_size):
+    count = 0
+    async for _ in read_xml(path, item_depth=2, batch_size=batch_size):
+        count += 1
+    return count
+
+
+def run(path, batch_size):
+    start = time.perf_counter()
+    count = asyncio.get_event_loop().run_until_complete(consume(path, batch_size))
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"batch_size={batch_size:>6}: {count / elapsed:>12,.0f} items/sec, peak RSS {peak_rss:,.1f} MiB")
+
+
+def main(items):
+    path = make_file(items)
+    try:
+        for batch_size in BATCH_SIZES:
+            subprocess.run([sys.executable, __file__, "--run", path, str(batch_size)], check=True)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import os
+
+import aiohttp
+from aiohttp import web
+
+from aiodata.utils import download, download_many
+
+
+async def _start(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def _serve(path):
+    app = web.Application()
+    app.router.add_get("/data.bin", lambda request: web.FileResponse(path))
+    runner, base_url = await _start(app)
+    return runner, base_url + "/data.bin"
+
+
+def test_parallel_ranged_download(tmpdir):
+    content = os.urandom(2 * 1024 * 1024 + 123)
+    source = tmpdir.mkdir("source").join("data.bin")
+    source.write_binary(content)
+    target = tmpdir.mkdir("target")
+
+    async def run():
+        runner, url = await _serve(str(source))
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await download(session, url, download_dir=str(target), connections=16,
+                                      segment_size=64 * 1024, checksum=hashlib.sha256(content).hexdigest())
+        finally:
+            await runner.cleanup()
+
+    filename = asyncio.get_event_loop().run_until_complete(run())
+
+    with open(filename, "rb") as f:
+        assert f.read() == content
+    assert os.listdir(str(target)) == ["data.bin"]
+
+
+def test_download_many_same_basename(tmpdir):
+    async def handler(request):
+        body = request.match_info["month"].encode() * 100000
+        response = web.StreamResponse()
+        response.content_length = len(body)
+        await response.prepare(request)
+        for i in range(0, len(body), 10000):
+            await response.write(body[i:i + 10000])
+            await asyncio.sleep(0.001)
+        return response
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{month}/data.csv", handler)
+        runner, base_url = await _start(app)
+        try:
+            urls = [f"{base_url}/{month}/data.csv" for month in ("a", "b")]
+            return urls, await download_many(urls, download_dir=str(tmpdir), skip_unchanged=False)
+        finally:
+            await runner.cleanup()
+
+    urls, results = asyncio.get_event_loop().run_until_complete(run())
+
+    assert len(set(results.values())) == 2
+    for url, month in zip(urls, "ab"):
+        with open(results[url], "rb") as f:
+            assert f.read() == month.encode() * 100000
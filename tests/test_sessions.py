@@ -0,0 +1,46 @@
+import asyncio
+
+from aiohttp import web
+
+from aiodata.api.sessions import APISession
+
+
+SPEC = {
+    "swagger": "2.0",
+    "info": {"title": "Pets", "version": "1.0"},
+    "paths": {
+        "/pets/{petId}": {
+            "get": {
+                "operationId": "getPet",
+                "parameters": [{"name": "petId", "in": "path", "required": True, "type": "integer"}],
+                "responses": {"200": {"description": "A pet"}}
+            }
+        }
+    },
+    "definitions": {}
+}
+
+
+def test_operation_url_without_base_path():
+    app = web.Application()
+    app.router.add_get("/spec.json", lambda request: web.json_response(SPEC))
+    app.router.add_get("/pets/{petId}", lambda request: web.json_response({"id": int(request.match_info["petId"])}))
+
+    async def run():
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            session = await APISession.from_url(f"http://127.0.0.1:{port}/spec.json")
+            try:
+                assert session.base_url == f"http://127.0.0.1:{port}/"
+                pet = await getattr(session, "/pets/{petId}").getPet(petId=7)
+                return pet["id"]
+            finally:
+                await session.close()
+        finally:
+            await runner.cleanup()
+
+    assert asyncio.get_event_loop().run_until_complete(run()) == 7
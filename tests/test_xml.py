@@ -0,0 +1,16 @@
+import asyncio
+
+from aiodata.files.xml import read_xml
+
+
+def test_read_xml_paths(tmpdir):
+    source = tmpdir.join("data.xml")
+    source.write('<root><item id="1"><name>a</name></item><item id="2"><name>b</name></item></root>')
+
+    async def run():
+        return [(path, item) async for path, item in read_xml(str(source), item_depth=2, batch_size=1)]
+
+    result = asyncio.get_event_loop().run_until_complete(run())
+    assert [item["name"] for _, item in result] == ["a", "b"]
+    assert [path for path, _ in result] == [[("root", None), ("item", {"id": "1"})],
+                                            [("root", None), ("item", {"id": "2"})]]